@@ -1,196 +1,687 @@
+import argparse
 import asyncio
+import itertools
 import json
+import multiprocessing
+import os
 import time
-import threading
-from typing import Set, Any
+from collections import Counter
+from typing import Set, Any, Sequence
 from server.playerHandler import PlayerHandler
+from server.clientSession import ClientSession
+from server.tickScheduler import TickScheduler
+from server.adaptiveRate import LoadGovernor, ChangeLog, client_interval, NEAR_RADIUS, FAR_EVERY
+from server.broadcast import players_frame, frame_failed, apply_player_message
+from server.shard import ShardRouter, ShardConfig
+from server.sharedTable import SharedPlayerTable, SharedTableSync
+from server.backbone import Backbone, InProcessBackbone, BrokerBackbone, FULL_STATE_INTERVAL
+from server.chatStore import ChatStore, ChatEntry, encode_chat_update, CHAT_CHANNELS
+from server.metrics import METRICS, serve_metrics
+from server.snapshot import SnapshotWriter, read_snapshot
+from server.resume import ResumeTokens
+from server.admission import connection_gate, message_type, MAX_MESSAGE_SIZE
+from server import protocol
 
 from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+from websockets.frames import CloseCode
 
 PORT = 8989
+# Players and chat are saved here for warm restarts (with --broker, one file per node)
+SNAPSHOT_PATH = "server_state.json"
+# JSON metrics at http://host:METRICS_PORT/metrics (worker i of --workers uses METRICS_PORT + i)
+METRICS_PORT = 9189
+# Broadcast ticks per second; lowered automatically while ticks overrun (see LoadGovernor).
+# Clients interpolate between frames (OnlineManager.get_interpolated_players), so 20 looks smooth
+TICK_RATE = 20
+# Seconds between keepalive pings, which also measure each client's RTT
+PING_INTERVAL = 5.0
+# Seconds a new connection gets to send its hello (which may carry a resume token) before it
+# is registered as a new player anyway
+HELLO_WAIT = 0.5
+# Delta clients get a full players_update at least this often to recover from any drift
+KEYFRAME_INTERVAL = 1.0
+# Clients only receive players on their own map within this many pixels (16 tiles)
+VIEW_RADIUS = 1024.0
+# One worker process per map in --shards mode
+SHARD_MAPS = ["map.tmx", "gym.tmx", "shop.tmx", "delta.tmx"]
+# Player slots in the shared table for --workers mode (split evenly between workers)
+SHARED_TABLE_CAPACITY = 4096
+# "proximity" chat reaches players within this many pixels of the sender (8 tiles)
+PROXIMITY_RADIUS = 512.0
+# Upper bound on nodes sharing one world through --broker; node K owns ids K, K + MAX_NODES, ...
+MAX_NODES = 64
 
 PLAYER_HANDLER = PlayerHandler()
-PLAYER_HANDLER.start()
-
-# ------------------------------
-# Simple in-memory chat storage
-# ------------------------------
-class ChatStore:
-    def __init__(self) -> None:
-        self._lock = threading.Lock()
-        self._next_id = 1
-        self._messages: list[dict] = []
-
-    def add(self, sender_id: int, text: str) -> dict:
-        # Sanitize
-        t = (text or "").strip()
-        if len(t) > 200:
-            t = t[:200]
-        if not t:
-            raise ValueError("empty")
-        with self._lock:
-            msg = {
-                "id": self._next_id,
-                "from": sender_id,
-                "text": t,
-                "ts": time.time(),
-            }
-            self._messages.append(msg)
-            self._next_id += 1
-            # Keep only the last N to avoid unbounded growth
-            if len(self._messages) > 1000:
-                self._messages = self._messages[-800:]
-            return msg
-
-    def list_since(self, since_id: int) -> list[dict]:
-        with self._lock:
-            if since_id <= 0:
-                return list(self._messages[-100:])  # cap response size
-            # Find first index with id > since_id
-            # Messages are appended in increasing id order
-            out: list[dict] = []
-            for m in self._messages:
-                if int(m.get("id", 0)) > since_id:
-                    out.append(m)
-            # Cap size
-            if len(out) > 200:
-                out = out[-200:]
-            return out
+# Set in --workers mode: mirrors PLAYER_HANDLER to/from the other workers
+SHARED_SYNC: SharedTableSync | None = None
+# Player updates and chat shared with other nodes (only this one unless --broker is given)
+BACKBONE: Backbone = InProcessBackbone(0)
+NODE_ID = 0
+NODE_ID_STEP = 1
 
 CHAT = ChatStore()
+# Chat accepted since the last tick; sent by flush_chat() as one chat_update per client
+PENDING_CHAT: list[ChatEntry] = []
+
+# Track connected clients. Only touched from the event loop and never across
+# an await, so broadcasting needs no lock and can't block new connections.
+CONNECTED_CLIENTS: Set[ClientSession] = set()
+# Connections still waiting for their hello; they count against MAX_CONNECTIONS too
+HANDSHAKING = 0
+# Set by the broadcast loop while ticks overrun even at the lowest rate; clients' position
+# updates are then throttled harder (see server.admission)
+SHEDDING = False
+# Session currently playing each player id, so a resumed player can be taken off a stale connection
+SESSIONS: dict[int, ClientSession] = {}
+
+
+def drop_player(pid: int) -> None:
+    # Looked up at call time: main() replaces PLAYER_HANDLER in --broker mode
+    PLAYER_HANDLER.unregister(pid)
+
 
-# Track connected clients
-CONNECTED_CLIENTS: Set[Any] = set()
-CLIENTS_LOCK = asyncio.Lock()
+RESUME = ResumeTokens(drop_player)
 
 
 async def broadcast_player_update():
-    """Broadcast player list to all connected clients periodically"""
+    """
+    Broadcast player state to all connected clients every tick.
+    Each client gets the players within VIEW_RADIUS (see players_frame), with
+    a full keyframe for delta clients every KEYFRAME_INTERVAL. Clients are paced
+    individually by RTT and backlog, so not every client gets every tick.
+    """
+    global SHEDDING
+    scheduler = TickScheduler(TICK_RATE)
+    governor = LoadGovernor(scheduler, TICK_RATE)
+    # One second of changes at the full rate; clients skipped longer get a keyframe
+    changes = ChangeLog(TICK_RATE)
+    last_keyframe = time.monotonic()
+    last_full_state = last_keyframe
     while True:
-        await asyncio.sleep(0.0167)  # 60 updates per second
-        players = PLAYER_HANDLER.list_players()
-        message = {
-            "type": "players_update",
-            "players": players,
-            "timestamp": time.time()
-        }
-        msg_json = json.dumps(message)
-        # Broadcast to all connected clients
-        disconnected = set()
-        async with CLIENTS_LOCK:
-            for client in CONNECTED_CLIENTS:
-                try:
-                    await client.send(msg_json)
-                except Exception:
-                    disconnected.add(client)
-            # Remove disconnected clients
-            CONNECTED_CLIENTS.difference_update(disconnected)
+        now = await scheduler.next_tick()
+        started = time.perf_counter()
+        # Apply the latest update each player sent since the previous tick
+        PLAYER_HANDLER.apply_pending()
+        if SHARED_SYNC:
+            SHARED_SYNC.sync(PLAYER_HANDLER)
+        changed, removed = PLAYER_HANDLER.drain_changes()
+        keyframe_due = now - last_keyframe >= KEYFRAME_INTERVAL
+        if keyframe_due:
+            last_keyframe = now
 
+        tick = changes.record(changed)
 
-async def handle_client(websocket: Any):
-    """Handle a WebSocket client connection"""
-    player_id = -1
-    
-    async with CLIENTS_LOCK:
-        CONNECTED_CLIENTS.add(websocket)
-    
-    try:
-        # Register player on connection - server assigns ID
-        player_id = PLAYER_HANDLER.register()
-        await websocket.send(json.dumps({
+        # Broadcast to all connected clients; frames are queued, never awaited
+        for client in CONNECTED_CLIENTS:
+            if keyframe_due:
+                client.keyframe_owed = True
+            # Half a tick of slack so float error doesn't skip a client that is due
+            if client.next_send > now + scheduler.interval * 0.5:
+                continue
+            # A frame still waiting to go out means the client can't keep up: back off
+            backlogged = client.position_pending
+            client.send_interval = client_interval(client.send_interval, scheduler.interval, client.rtt, backlogged)
+            client.next_send = now + client.send_interval
+            if backlogged:
+                continue
+            since = changes.since(client.last_tick)
+            client.last_tick = tick
+            # One client's frame failing must not stop the tick for everyone else
+            try:
+                frame = players_frame(
+                    PLAYER_HANDLER, client, changed if since is None else since,
+                    client.keyframe_owed or since is None, VIEW_RADIUS, NEAR_RADIUS, FAR_EVERY
+                )
+            except Exception:
+                frame_failed(client)
+                continue
+            client.keyframe_owed = False
+            if frame is not None:
+                client.send_position(frame)
+
+        # Share our own players' changes (not the mirrored remote ones) with other nodes,
+        # and now and then all of them, for nodes that joined late and as our heartbeat
+        BACKBONE.publish_players(
+            {pid: p for pid, p in changed.items() if pid % NODE_ID_STEP == NODE_ID},
+            [pid for pid in removed if pid % NODE_ID_STEP == NODE_ID]
+        )
+        if now - last_full_state >= FULL_STATE_INTERVAL:
+            last_full_state = now
+            BACKBONE.publish_full({
+                pid: {"id": pid, "x": x, "y": y, "map": map_name, "direction": direction}
+                for pid, x, y, map_name, direction in PLAYER_HANDLER.states()
+                if pid % NODE_ID_STEP == NODE_ID
+            })
+        flush_chat()
+        BACKBONE.flush()
+        BACKBONE.expire_nodes(now)
+        duration = time.perf_counter() - started
+        governor.observe(duration)
+        SHEDDING = governor.overloaded
+        METRICS.tick_duration.observe(duration)
+        METRICS.tick_rate = scheduler.rate
+        METRICS.tick_overruns = scheduler.overruns
+        METRICS.ticks_skipped = scheduler.skipped
+
+
+def collect_metrics() -> dict:
+    """Gauges read off the live server state for a /metrics scrape."""
+    if ROUTER:
+        maps = Counter(ROUTER.map_of(pid) for pid in ROUTER.sessions)
+    else:
+        maps = Counter(PLAYER_HANDLER.map_counts())
+    depths = {client.player_id: client.queue_depth for client in CONNECTED_CLIENTS}
+    return {
+        "clients": len(CONNECTED_CLIENTS),
+        "players": sum(maps.values()),
+        "players_per_map": {name or "(none)": n for name, n in maps.items()},
+        "send_queue": {
+            "max": max(depths.values(), default=0),
+            "total": sum(depths.values()),
+            # Only clients with something waiting, by player id
+            "backlogged": {pid: depth for pid, depth in depths.items() if depth},
+        },
+        "chat_store_size": len(CHAT),
+        "chat_pending": len(PENDING_CHAT),
+        "shedding": SHEDDING,
+    }
+
+
+def capture_state() -> dict:
+    """What SnapshotWriter saves: our own players (not mirrored remote ones) and the chat."""
+    players = PLAYER_HANDLER.dump()
+    players["players"] = [p for p in players["players"] if p[0] % NODE_ID_STEP == NODE_ID]
+    tokens = {str(pid): token for pid, token in RESUME.dump().items() if pid % NODE_ID_STEP == NODE_ID}
+    return {"players": players, "chat": CHAT.dump(), "tokens": tokens}
+
+
+def restore_state(path: str) -> None:
+    state = read_snapshot(path)
+    if state is None:
+        return
+    # Restored players wait out the resume grace window for their clients, like any disconnect
+    pids = PLAYER_HANDLER.restore(state["players"])
+    RESUME.restore(state.get("tokens", {}), pids)
+    CHAT.restore(state["chat"])
+    print(f"[Server] Restored {len(pids)} players and {len(CHAT)} chat messages from {path}")
+
+
+def attach_player(session: ClientSession, hello: dict | None) -> None:
+    """
+    Give a new connection its player: the one its resume token names if that
+    player is still around (only the chat it missed is sent), else a new one.
+    """
+    token = hello.get("resume_token") if hello else None
+    pid = RESUME.claim(token) if isinstance(token, str) else None
+    if pid is not None and pid in PLAYER_HANDLER.players:
+        stale = SESSIONS.get(pid)
+        if stale is not None:
+            # The old connection hasn't noticed it's dead yet
+            stale.close(1000, "resumed elsewhere")
+        session.player_id = pid
+        SESSIONS[pid] = session
+        session.send(json.dumps({
             "type": "registered",
-            "id": player_id
+            "id": pid,
+            "token": token,
+            "resumed": True
         }))
-        
-        # Send initial player list
-        players = PLAYER_HANDLER.list_players()
-        await websocket.send(json.dumps({
-            "type": "players_update",
-            "players": players,
-            "timestamp": time.time()
+        try:
+            last_chat_id = int(hello.get("last_chat_id", 0))
+        except (TypeError, ValueError):
+            last_chat_id = 0
+        missed = [
+            msg for msg in CHAT.list_since(last_chat_id)
+            if msg.channel == "global" or msg.sender == pid
+        ]
+        if missed:
+            session.send(encode_chat_update(missed))
+        # Positions catch up by themselves: a new session's first players frame is a keyframe
+        return
+    if pid is not None:
+        RESUME.forget(pid)  # its player expired some other way
+
+    # Register player on connection - server assigns ID
+    pid = PLAYER_HANDLER.register()
+    session.player_id = pid
+    SESSIONS[pid] = session
+    session.send(json.dumps({
+        "type": "registered",
+        "id": pid,
+        "token": RESUME.issue(pid)
+    }))
+
+    # Send recent chat messages
+    session.send(recent_chat())
+
+
+def apply_remote_players(changed: dict, removed: list[int]) -> None:
+    """Mirror players owned by other nodes into PLAYER_HANDLER."""
+    for pid, p in changed.items():
+        try:
+            if pid in PLAYER_HANDLER.players:
+                PLAYER_HANDLER.update(pid, p["x"], p["y"], p["map"], p["direction"])
+            else:
+                PLAYER_HANDLER.adopt(pid, p["x"], p["y"], p["map"], p["direction"])
+        except ValueError:
+            pass  # we're out of map name codes; that player stays invisible here
+    for pid in removed:
+        PLAYER_HANDLER.unregister(pid)
+
+
+def apply_remote_chat(message: dict) -> None:
+    """Relay a chat message sent on another node to our clients."""
+    try:
+        PENDING_CHAT.append(CHAT.add(
+            int(message["from"]), str(message["text"]),
+            str(message.get("channel", "global")), str(message.get("map", ""))
+        ))
+    except ValueError:
+        pass
+
+
+def publish_chat(sender: ClientSession, text: str, channel: str = "global") -> None:
+    """Store a chat message from `sender`; it goes out with the next flush_chat()."""
+    if not text:
+        return
+    try:
+        # Use server-assigned ID
+        msg = CHAT.add(sender.player_id, text, channel, sender_map(sender.player_id))
+    except ValueError:
+        sender.send(json.dumps({
+            "type": "error",
+            "message": "empty_message"
+        }))
+        return
+    BACKBONE.publish_chat({"from": msg.sender, "text": msg.text, "channel": msg.channel, "map": msg.map})
+    PENDING_CHAT.append(msg)
+
+
+def sender_map(pid: int) -> str:
+    if ROUTER:
+        return ROUTER.map_of(pid)
+    player = PLAYER_HANDLER.players.get(pid)
+    return player.map if player else ""
+
+
+def chat_audience(msg: ChatEntry) -> set[int] | None:
+    """Player ids a message is for, or None for everyone."""
+    if msg.channel == "global":
+        return None
+    if ROUTER:
+        # The router doesn't know positions; proximity chat falls back to the map
+        return ROUTER.players_on_map(msg.map)
+    if msg.channel == "map":
+        return PLAYER_HANDLER.players_on_map(msg.map)
+    player = PLAYER_HANDLER.players.get(msg.sender)
+    if player is None or player.map != msg.map:
+        return set()  # sender left the map before the tick
+    return PLAYER_HANDLER.visible_ids(msg.sender, PROXIMITY_RADIUS)
+
+
+def flush_chat() -> None:
+    """
+    Send the chat accepted since the last tick. Each client gets at most one
+    chat_update holding every pending message it is subscribed to and within
+    reach of; clients receiving the same messages share one encoded frame.
+    """
+    if not PENDING_CHAT:
+        return
+    audiences = [(msg, chat_audience(msg)) for msg in PENDING_CHAT]
+    PENDING_CHAT.clear()
+    started = time.perf_counter()
+    frames: dict[tuple[int, ...], str] = {}
+    for client in CONNECTED_CLIENTS:
+        pid = client.player_id
+        entries = [
+            msg for msg, audience in audiences
+            # Senders always get their own message back
+            if msg.sender == pid or (
+                msg.channel in client.chat_channels and (audience is None or pid in audience)
+            )
+        ]
+        if not entries:
+            continue
+        key = tuple(msg.id for msg in entries)
+        frame = frames.get(key)
+        if frame is None:
+            frame = frames[key] = encode_chat_update(entries)
+        client.send(frame)
+    METRICS.encode_time.observe(time.perf_counter() - started)
+
+
+async def flush_chat_loop():
+    """Tick for modes without a broadcast loop in this process (--shards)."""
+    scheduler = TickScheduler(TICK_RATE)
+    while True:
+        await scheduler.next_tick()
+        flush_chat()
+        BACKBONE.flush()
+
+
+def subscribe_chat(session: ClientSession, channels: Any) -> None:
+    """Replace the chat channels a client receives; unknown names are ignored."""
+    if not isinstance(channels, list):
+        return
+    session.chat_channels = {str(c) for c in channels if c in CHAT_CHANNELS}
+
+
+def answer_ping(session: ClientSession, data: dict) -> None:
+    """Echo a client's ping with our clock, for its round trip and clock offset."""
+    session.send(json.dumps({
+        "type": "pong",
+        "t": data.get("t"),
+        "server_time": time.time()
+    }))
+
+
+def recent_chat() -> str:
+    # Backfill only covers the global channel: other messages were for whoever was there
+    return encode_chat_update([msg for msg in CHAT.list_since(0) if msg.channel == "global"])
+
+
+def admit_message(session: ClientSession, message: str | bytes) -> bool:
+    """Apply the client's rate limits to one message; False if it is dropped."""
+    if session.closed:
+        return False
+    msg_type = message_type(message)
+    if session.limits.admit(msg_type, time.monotonic(), SHEDDING):
+        return True
+    if session.limits.abusive:
+        METRICS.rate_limit_disconnects += 1
+        session.close(1008, "rate limit exceeded")
+    elif msg_type == "chat_send":
+        # The player typed this, so say why it went nowhere
+        session.send(json.dumps({
+            "type": "error",
+            "message": "rate_limited",
+            "retry_after": round(session.limits.retry_after(msg_type), 2)
+        }))
+    return False
+
+
+def handle_message(session: ClientSession, message: str | bytes) -> None:
+    if not admit_message(session, message):
+        return
+    try:
+        if isinstance(message, bytes):
+            if message[0] == protocol.KIND_PLAYER_UPDATE:
+                # Hot path: skip building the intermediate dict
+                METRICS.count_received("player_update", len(message))
+                x, y, map_name, direction = protocol.decode_player_update(message)
+                PLAYER_HANDLER.submit(session.player_id, x, y, map_name, direction)
+                return
+            data = protocol.decode_frame(message)
+        else:
+            data = json.loads(message)
+        msg_type = data.get("type")
+        METRICS.count_received(str(msg_type), len(message))
+
+        if apply_player_message(PLAYER_HANDLER, session, data):
+            pass
+
+        elif msg_type == "chat_send":
+            publish_chat(session, str(data.get("text", "")), str(data.get("channel", "global")))
+
+        elif msg_type == "chat_subscribe":
+            subscribe_chat(session, data.get("channels"))
+
+        elif msg_type == "ping":
+            answer_ping(session, data)
+
+    except json.JSONDecodeError:
+        session.send(json.dumps({
+            "type": "error",
+            "message": "invalid_json"
         }))
-        
-        # Send recent chat messages
-        recent_chat = CHAT.list_since(0)
-        await websocket.send(json.dumps({
-            "type": "chat_update",
-            "messages": recent_chat
+    except Exception as e:
+        session.send(json.dumps({
+            "type": "error",
+            "message": str(e)
         }))
-        
+
+
+def count_oversize(websocket: Any) -> None:
+    # websockets itself closes with 1009 on frames over MAX_MESSAGE_SIZE
+    sent = websocket.protocol.close_sent
+    if sent is not None and sent.code == CloseCode.MESSAGE_TOO_BIG:
+        METRICS.oversize_disconnects += 1
+
+
+def parse_hello(message: str | bytes) -> dict | None:
+    if isinstance(message, bytes):
+        return None
+    try:
+        data = json.loads(message)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) and data.get("type") == "hello" else None
+
+
+def open_connections() -> int:
+    """Connections connection_gate() counts: playing clients and those still saying hello."""
+    return len(CONNECTED_CLIENTS) + HANDSHAKING
+
+
+async def handle_client(websocket: Any):
+    """Handle a WebSocket client connection"""
+    global HANDSHAKING
+    session = ClientSession(websocket)
+    # Position frames go binary if the client negotiated our subprotocol
+    session.binary = websocket.subprotocol == protocol.BINARY_SUBPROTOCOL
+    writer_task = asyncio.create_task(session.run_writer())
+    
+    try:
+        # Our client says hello first; a resume token in it gets its old player back
+        HANDSHAKING += 1
+        try:
+            first = await asyncio.wait_for(websocket.recv(), HELLO_WAIT)
+        except asyncio.TimeoutError:
+            first = None
+        finally:
+            HANDSHAKING -= 1
+        attach_player(session, parse_hello(first) if first is not None else None)
+        CONNECTED_CLIENTS.add(session)
+        if first is not None:
+            handle_message(session, first)
+
         # Handle incoming messages
         async for message in websocket:
-            try:
-                data = json.loads(message)
-                msg_type = data.get("type")
-                
-                
-                if msg_type == "player_update":
-                    # Update player position - use server-assigned ID, ignore client ID
-                    x = float(data.get("x", 0))
-                    y = float(data.get("y", 0))
-                    map_name = str(data.get("map", ""))
-                    direction = str(data.get("direction", "DOWN"))
-                    
-                    # Use the server-assigned player_id, not client-provided
-                    # HINT: This part might be helpful for direction change
-                    # Maybe you can add other parameters? 
-                    PLAYER_HANDLER.update(player_id, x, y, map_name, direction)
-                    
-                elif msg_type == "chat_send":
-                    # Send chat message - use server-assigned ID
-                    text = str(data.get("text", ""))
-                    if text:
-                        try:
-                            msg = CHAT.add(player_id, text)  # Use server-assigned ID
-                            # Broadcast to all clients
-                            chat_msg = {
-                                "type": "chat_update",
-                                "messages": [msg]
-                            }
-                            chat_json = json.dumps(chat_msg)
-                            async with CLIENTS_LOCK:
-                                disconnected = set()
-                                for client in CONNECTED_CLIENTS:
-                                    try:
-                                        await client.send(chat_json)
-                                    except Exception:
-                                        disconnected.add(client)
-                                CONNECTED_CLIENTS.difference_update(disconnected)
-                        except ValueError:
-                            await websocket.send(json.dumps({
-                                "type": "error",
-                                "message": "empty_message"
-                            }))
-                            
-            except json.JSONDecodeError:
-                await websocket.send(json.dumps({
-                    "type": "error",
-                    "message": "invalid_json"
-                }))
-            except Exception as e:
-                await websocket.send(json.dumps({
-                    "type": "error",
-                    "message": str(e)
-                }))
+            handle_message(session, message)
                 
+    except ConnectionClosed:
+        pass  # went away before saying hello
     except Exception as e:
         print(f"[Server] Client handler error: {e}")
     finally:
-        # Unregister player on disconnect
-        if player_id >= 0:
-            PLAYER_HANDLER.unregister(player_id)
-        async with CLIENTS_LOCK:
-            CONNECTED_CLIENTS.discard(websocket)
+        count_oversize(websocket)
+        # Keep the player for a while in case the client comes back with its token
+        pid = session.player_id
+        if pid >= 0 and SESSIONS.get(pid) is session:
+            del SESSIONS[pid]
+            RESUME.detach(pid)
+        CONNECTED_CLIENTS.discard(session)
+        writer_task.cancel()
+
+
+# ------------------------------
+# Map-sharded mode (--shards)
+# ------------------------------
+ROUTER: ShardRouter | None = None
+SHARDED_IDS = itertools.count()
+
 
+async def handle_client_sharded(websocket: Any):
+    """Handle a WebSocket client connection, with simulation done by the map workers"""
+    assert ROUTER is not None
+    session = ClientSession(websocket)
+    session.binary = websocket.subprotocol == protocol.BINARY_SUBPROTOCOL
+    session.player_id = next(SHARDED_IDS)
+    writer_task = asyncio.create_task(session.run_writer())
 
-async def main():
-    print(f"[Server] Running WebSocket server on ws://0.0.0.0:{PORT}")
-    # Start broadcast task
+    CONNECTED_CLIENTS.add(session)
+    ROUTER.open(session)
+    try:
+        session.send(json.dumps({
+            "type": "registered",
+            "id": session.player_id
+        }))
+        session.send(recent_chat())
+        async for message in websocket:
+            # The workers do the parsing
+            METRICS.count_received(message_type(message), len(message))
+            if not admit_message(session, message):
+                continue
+            if isinstance(message, str) and ('"chat_subscribe"' in message or '"ping"' in message):
+                # Subscriptions live with the session here, not in the workers, and pings get answered here
+                try:
+                    data = json.loads(message)
+                except json.JSONDecodeError:
+                    data = {}
+                if data.get("type") == "chat_subscribe":
+                    subscribe_chat(session, data.get("channels"))
+                    continue
+                if data.get("type") == "ping":
+                    answer_ping(session, data)
+                    continue
+            ROUTER.forward(session, message)
+    except ConnectionClosed:
+        pass  # dropped without a close frame, which is a normal way to leave
+    except Exception as e:
+        print(f"[Server] Client handler error: {e}")
+    finally:
+        count_oversize(websocket)
+        ROUTER.close(session)
+        CONNECTED_CLIENTS.discard(session)
+        writer_task.cancel()
+
+
+# ------------------------------
+# SO_REUSEPORT workers (--workers N)
+# ------------------------------
+def run_worker(index: int, workers: int, table_name: str, port: int, metrics_port: int) -> None:
+    """multiprocessing target: one identical server process sharing the port."""
+    try:
+        asyncio.run(main_worker(index, workers, table_name, port, metrics_port))
+    except KeyboardInterrupt:
+        pass
+
+
+async def main_worker(index: int, workers: int, table_name: str, port: int, metrics_port: int):
+    global PLAYER_HANDLER, SHARED_SYNC
+    # Interleaved ids keep them unique across workers without coordination
+    PLAYER_HANDLER = PlayerHandler(id_start=index, id_step=workers)
+    table = SharedPlayerTable.attach(table_name, SHARED_TABLE_CAPACITY)
+    SHARED_SYNC = SharedTableSync(table, index, workers)
+    PLAYER_HANDLER.start()
     asyncio.create_task(broadcast_player_update())
+    if metrics_port:
+        # Each worker has its own counters, so each gets its own port
+        await serve_metrics(metrics_port + index, collect_metrics)
+    try:
+        async with serve(handle_client, "0.0.0.0", port, select_subprotocol=select_subprotocol,
+                         ping_interval=PING_INTERVAL, reuse_port=True, max_size=MAX_MESSAGE_SIZE,
+                         process_request=connection_gate(open_connections)):
+            await asyncio.Future()  # run forever
+    finally:
+        table.close()
+
+
+def run_workers(workers: int, port: int = PORT, metrics_port: int = METRICS_PORT) -> None:
+    table = SharedPlayerTable.create(SHARED_TABLE_CAPACITY)
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(i, workers, table.name, port, metrics_port),
+                                name=f"Worker-{i}")
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    print(f"[Server] Running {workers} workers on ws://0.0.0.0:{port}")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+    finally:
+        table.close(unlink=True)
+
+
+def select_subprotocol(connection: Any, subprotocols: Sequence[str]) -> str | None:
+    """Accept the binary protocol when offered, plain JSON otherwise."""
+    if protocol.BINARY_SUBPROTOCOL in subprotocols:
+        return protocol.BINARY_SUBPROTOCOL
+    return None
+
+
+async def main(sharded: bool = False, port: int = PORT, broker: str | None = None, node: int = 0,
+               metrics_port: int = METRICS_PORT, snapshot: str = SNAPSHOT_PATH):
+    global ROUTER, BACKBONE, PLAYER_HANDLER, NODE_ID, NODE_ID_STEP
+    if broker:
+        # Interleaved ids keep them unique across nodes without coordination
+        NODE_ID, NODE_ID_STEP = node, MAX_NODES
+        PLAYER_HANDLER = PlayerHandler(id_start=NODE_ID, id_step=NODE_ID_STEP)
+        BACKBONE = BrokerBackbone(NODE_ID, broker)
+        print(f"[Server] Node {NODE_ID} joining broker {broker}")
+    BACKBONE.on_players = apply_remote_players
+    BACKBONE.on_chat = apply_remote_chat
+    await BACKBONE.start()
+    if sharded:
+        ROUTER = ShardRouter(ShardConfig(SHARD_MAPS, TICK_RATE, VIEW_RADIUS, KEYFRAME_INTERVAL), publish_chat)
+        await ROUTER.start()
+        print(f"[Server] Started {len(SHARD_MAPS)} map shards: {', '.join(SHARD_MAPS)}")
+        asyncio.create_task(flush_chat_loop())
+        handler = handle_client_sharded
+    else:
+        if snapshot:
+            if broker:
+                root, ext = os.path.splitext(snapshot)
+                snapshot = f"{root}-node{NODE_ID}{ext}"
+            restore_state(snapshot)
+            snapshots = SnapshotWriter(snapshot, capture_state)
+            snapshots.start()
+        # Start idle-player expiry and broadcast task
+        PLAYER_HANDLER.start()
+        asyncio.create_task(broadcast_player_update())
+        handler = handle_client
+    if metrics_port:
+        await serve_metrics(metrics_port, collect_metrics)
+        print(f"[Server] Metrics on http://0.0.0.0:{metrics_port}/metrics")
+    print(f"[Server] Running WebSocket server on ws://0.0.0.0:{port}")
     # Start server
-    async with serve(handle_client, "0.0.0.0", PORT):
-        await asyncio.Future()  # run forever
+    try:
+        async with serve(handler, "0.0.0.0", port, select_subprotocol=select_subprotocol,
+                         ping_interval=PING_INTERVAL, max_size=MAX_MESSAGE_SIZE,
+                         process_request=connection_gate(open_connections)):
+            await asyncio.Future()  # run forever
+    finally:
+        if ROUTER:
+            ROUTER.stop()
+        elif snapshot:
+            snapshots.stop()
+        await BACKBONE.stop()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Monster Go online server")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--shards", action="store_true",
+                        help="simulate each map in its own worker process")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="run N identical processes on the port via SO_REUSEPORT (Linux/BSD)")
+    parser.add_argument("--broker", default=None,
+                        help="share the world with other nodes via server/broker.py (tcp://host:port or unix:///path)")
+    parser.add_argument("--node", type=int, default=0,
+                        help=f"this node's number with --broker, 0..{MAX_NODES - 1} and unique per node")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="HTTP port for /metrics, 0 to disable")
+    parser.add_argument("--snapshot", default=SNAPSHOT_PATH,
+                        help="file to save players and chat to for warm restarts, empty to disable "
+                             "(not with --shards or --workers)")
+    args = parser.parse_args()
+    if args.workers > 1:
+        run_workers(args.workers, args.port, args.metrics_port)
+    else:
+        asyncio.run(main(sharded=args.shards, port=args.port, broker=args.broker, node=args.node,
+                         metrics_port=args.metrics_port, snapshot=args.snapshot))
\ No newline at end of file
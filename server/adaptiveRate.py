@@ -0,0 +1,111 @@
+"""
+Adaptive broadcast rates.
+
+LoadGovernor lowers the global tick rate while ticks eat most of their budget
+and raises it back once they don't. On top of that every client is paced on
+its own (client_interval): a client with a long round trip or whose previous
+frame hasn't gone out yet is sent to less often. ChangeLog remembers the last
+ticks' changes, so a client skipped for a few ticks still gets every move in
+its next delta.
+"""
+import itertools
+from collections import deque
+
+from server.tickScheduler import TickScheduler
+
+# Global rate bounds, and the share of a tick's interval its work should stay within
+MIN_TICK_RATE = 10.0
+HIGH_WATER = 0.8
+LOW_WATER = 0.4
+# Ticks between two global rate changes, so each change gets measured first
+GOVERNOR_COOLDOWN = 30
+# Clients at or under RTT_GOOD get every tick; at RTT_BAD and above, MIN_CLIENT_RATE
+RTT_GOOD = 0.05
+RTT_BAD = 0.3
+MIN_CLIENT_RATE = 5.0
+# Players moving farther than this from a client are only sent every FAR_EVERY-th frame
+NEAR_RADIUS = 512.0
+FAR_EVERY = 4
+
+
+class LoadGovernor:
+    """Steers a TickScheduler's rate between min_rate and max_rate from measured tick durations."""
+    scheduler: TickScheduler
+    min_rate: float
+    max_rate: float
+    _average: float
+    _cooldown: int
+
+    def __init__(self, scheduler: TickScheduler, max_rate: float, min_rate: float = MIN_TICK_RATE):
+        self.scheduler = scheduler
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._average = 0.0
+        self._cooldown = GOVERNOR_COOLDOWN
+
+    @property
+    def overloaded(self) -> bool:
+        """Ticks still run over budget at the lowest rate, so incoming work has to be shed."""
+        return self.scheduler.rate <= self.min_rate and self._average > HIGH_WATER * self.scheduler.interval
+
+    def observe(self, duration: float) -> None:
+        """Feed the time one tick's work took, in seconds."""
+        self._average += (duration - self._average) * 0.1
+        self._cooldown -= 1
+        if self._cooldown > 0:
+            return
+        rate = self.scheduler.rate
+        budget = self.scheduler.interval
+        if self._average > HIGH_WATER * budget and rate > self.min_rate:
+            self.scheduler.set_rate(max(self.min_rate, rate * 0.8))
+        elif self._average < LOW_WATER * budget and rate < self.max_rate:
+            self.scheduler.set_rate(min(self.max_rate, rate * 1.1))
+        else:
+            return
+        self._cooldown = GOVERNOR_COOLDOWN
+
+
+def client_interval(current: float, tick_interval: float, rtt: float, backlogged: bool) -> float:
+    """
+    Next send interval for one client. The RTT sets the floor; a backlog (its
+    last frame still queued) doubles the interval, which then recovers by 10%
+    per send once the client keeps up.
+    """
+    slowest = 1.0 / MIN_CLIENT_RATE
+    if rtt <= RTT_GOOD:
+        floor = tick_interval
+    elif rtt >= RTT_BAD:
+        floor = slowest
+    else:
+        floor = tick_interval + (slowest - tick_interval) * (rtt - RTT_GOOD) / (RTT_BAD - RTT_GOOD)
+    floor = max(floor, tick_interval)
+    if backlogged:
+        return min(max(current, floor) * 2.0, slowest)
+    return max(floor, current * 0.9)
+
+
+class ChangeLog:
+    """The `changed` dicts of the last few ticks, numbered by tick."""
+    tick: int
+    _ticks: deque[dict]
+
+    def __init__(self, length: int):
+        self.tick = 0
+        self._ticks = deque(maxlen=length)
+
+    def record(self, changed: dict) -> int:
+        self.tick += 1
+        self._ticks.append(changed)
+        return self.tick
+
+    def since(self, tick: int) -> dict | None:
+        """Latest state of every player changed after `tick`; None if the log doesn't reach back that far."""
+        behind = self.tick - tick
+        if behind > len(self._ticks):
+            return None
+        if behind == 1:
+            return self._ticks[-1]
+        out: dict = {}
+        for changed in itertools.islice(self._ticks, len(self._ticks) - behind, None):
+            out.update(changed)
+        return out
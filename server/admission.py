@@ -0,0 +1,129 @@
+"""
+Admission control: how many clients we take and how much each may send.
+
+Every connection gets token buckets per message type plus one for all of its
+messages. Position updates are the first thing shed: they must leave a reserve
+in the connection's shared bucket, so chat and control messages still get
+through when a client sends too much, and while the server is overloaded they
+cost several tokens each. Dropping a position is harmless because the next one
+carries the full state anyway. A client that keeps getting messages dropped is
+disconnected, so a flood costs us a bounded amount of work per second.
+"""
+import re
+from http import HTTPStatus
+from typing import Any, Callable
+
+from server.metrics import METRICS, client_type
+from server import protocol
+
+# Connections one process accepts; more are turned away with 503 + Retry-After
+MAX_CONNECTIONS = 2000
+# Seconds rejected clients are told to wait before retrying
+RETRY_AFTER = 5
+# Largest inbound frame, in bytes; websockets closes the connection (1009) on bigger ones
+MAX_MESSAGE_SIZE = 4096
+
+# (messages per second, burst) per message type; "other" covers every other type
+RATE_LIMITS: dict[str, tuple[float, float]] = {
+    "player_update": (75.0, 30.0),
+    "chat_send": (3.0, 6.0),
+    "other": (5.0, 10.0),
+}
+# All of a connection's messages together
+TOTAL_LIMIT = (100.0, 60.0)
+# Tokens of the shared bucket position updates may not touch
+POSITION_RESERVE = 20.0
+# What a position update costs while the server sheds load (75/s becomes 25/s)
+POSITION_SHED_COST = 3.0
+# Drops a client may cause (rate, burst) before it is disconnected; shed positions don't count
+DROP_LIMIT = (30.0, 300.0)
+# The first "type" key of a JSON message, however it is spaced (quotes inside strings are escaped)
+_TYPE_FIELD = re.compile(r'"type"\s*:\s*"([^"\\]*)"')
+
+
+def message_type(message: str | bytes) -> str:
+    """Type of an inbound message, read without parsing the rest of it; "other" if it has none."""
+    if isinstance(message, bytes):
+        return "player_update" if message[:1] == bytes([protocol.KIND_PLAYER_UPDATE]) else "other"
+    match = _TYPE_FIELD.search(message)
+    return match.group(1) if match else "other"
+
+
+class TokenBucket:
+    rate: float
+    burst: float
+    tokens: float
+    _stamp: float
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._stamp = now
+
+    def take(self, now: float, cost: float = 1.0, keep: float = 0.0) -> bool:
+        """Take `cost` tokens if at least `keep` are left afterwards."""
+        self.tokens = min(self.burst, self.tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+        if self.tokens - cost < keep:
+            return False
+        self.tokens -= cost
+        return True
+
+    def wait(self, cost: float = 1.0) -> float:
+        """Seconds until `cost` tokens are available (as of the last take())."""
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+
+class ConnectionLimits:
+    """The token buckets of one connection."""
+    # Set once the client has had too many messages dropped; the caller disconnects it
+    abusive: bool
+    _buckets: dict[str, TokenBucket]
+    _total: TokenBucket
+    _drops: TokenBucket
+
+    def __init__(self, now: float):
+        self.abusive = False
+        self._buckets = {t: TokenBucket(rate, burst, now) for t, (rate, burst) in RATE_LIMITS.items()}
+        self._total = TokenBucket(*TOTAL_LIMIT, now)
+        self._drops = TokenBucket(*DROP_LIMIT, now)
+
+    def admit(self, msg_type: str, now: float, shedding: bool = False) -> bool:
+        """Whether to handle a `msg_type` message arriving at `now`; counts the ones it drops."""
+        if msg_type == "player_update":
+            ok = (self._buckets["player_update"].take(now, POSITION_SHED_COST if shedding else 1.0)
+                  and self._total.take(now, keep=POSITION_RESERVE))
+            blame = not shedding
+        else:
+            bucket = self._buckets.get(msg_type) or self._buckets["other"]
+            ok = bucket.take(now) and self._total.take(now)
+            blame = True
+        if ok:
+            return True
+        key = client_type(msg_type)
+        METRICS.dropped[key] = METRICS.dropped.get(key, 0) + 1
+        if blame and not self._drops.take(now):
+            self.abusive = True
+        return False
+
+    def retry_after(self, msg_type: str) -> float:
+        """Seconds until another `msg_type` message would be accepted."""
+        bucket = self._buckets.get(msg_type) or self._buckets["other"]
+        return max(bucket.wait(), self._total.wait())
+
+
+def connection_gate(connected: Callable[[], int]) -> Callable[[Any, Any], Any]:
+    """
+    A websockets process_request hook turning clients away with 503 and a
+    Retry-After header once connected() reaches MAX_CONNECTIONS.
+    """
+    def process_request(connection: Any, request: Any) -> Any:
+        if connected() < MAX_CONNECTIONS:
+            return None
+        METRICS.connections_rejected += 1
+        response = connection.respond(HTTPStatus.SERVICE_UNAVAILABLE, "Server full, try again later\n")
+        response.headers["Retry-After"] = str(RETRY_AFTER)
+        return response
+
+    return process_request
@@ -0,0 +1,207 @@
+"""
+Pub/sub backbone that lets several server nodes serve one world.
+
+Each node publishes the changes of the players it owns and the chat messages
+its clients send; the backbone delivers them to every other node, which mirrors
+the remote players into its own PlayerHandler and relays the chat to its own
+clients. Publishes are buffered and sent as one batch per tick by flush().
+
+Changes alone don't reach a node that joined late, and say nothing when a node
+dies. So every FULL_STATE_INTERVAL each node also publishes all of its players
+as a "full" batch, which doubles as its heartbeat: the receiving side drops any
+of that node's players missing from it, and drops all of them once the node has
+been silent for NODE_TIMEOUT or the broker reports it gone.
+
+InProcessBackbone connects nodes living in the same process (a lone node just
+talks to itself and nothing is sent anywhere). BrokerBackbone talks to a
+server/broker.py process over TCP or a Unix socket, standing in for a real
+message bus.
+"""
+import asyncio
+import json
+import struct
+import time
+from abc import ABC, abstractmethod
+from typing import Callable
+
+PlayersCallback = Callable[[dict, list[int]], None]
+ChatCallback = Callable[[dict], None]
+
+# Length prefix of every broker frame
+LENGTH = struct.Struct("<I")
+# Seconds between a node's full-state batches, and the silence after which its players are dropped
+FULL_STATE_INTERVAL = 5.0
+NODE_TIMEOUT = 3 * FULL_STATE_INTERVAL
+
+
+class Backbone(ABC):
+    """Interface shared by all backbones."""
+    node: int
+    # Called for batches coming from other nodes
+    on_players: PlayersCallback | None
+    on_chat: ChatCallback | None
+    _changed: dict
+    _removed: list[int]
+    _chat: list[dict]
+    _full: bool
+    # Other nodes: the players we mirror from each, and when we last heard from it
+    _members: dict[int, set[int]]
+    _heard: dict[int, float]
+
+    def __init__(self, node: int):
+        self.node = node
+        self.on_players = None
+        self.on_chat = None
+        self._changed = {}
+        self._removed = []
+        self._chat = []
+        self._full = False
+        self._members = {}
+        self._heard = {}
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def publish_players(self, changed: dict, removed: list[int]) -> None:
+        """Queue changes of this node's own players (same shapes as drain_changes())."""
+        self._changed.update(changed)
+        for pid in removed:
+            self._changed.pop(pid, None)
+        self._removed.extend(removed)
+
+    def publish_full(self, players: dict) -> None:
+        """Queue every player this node owns (same shape as publish_players); call every FULL_STATE_INTERVAL."""
+        self._changed = dict(players)
+        self._full = True
+
+    def publish_chat(self, message: dict) -> None:
+        self._chat.append(message)
+
+    def flush(self) -> None:
+        """Send everything queued since the last flush as one batch; call once per tick."""
+        if not (self._changed or self._removed or self._chat or self._full):
+            return
+        batch = {"node": self.node, "players": self._changed, "removed": self._removed, "chat": self._chat}
+        if self._full:
+            batch["full"] = True
+        self._changed = {}
+        self._removed = []
+        self._chat = []
+        self._full = False
+        self._send(batch)
+
+    def expire_nodes(self, now: float) -> None:
+        """Drop the players of nodes silent for NODE_TIMEOUT as of `now` (monotonic); call once per tick."""
+        for node in [node for node, heard in self._heard.items() if now - heard > NODE_TIMEOUT]:
+            print(f"[Server] Node {node} went silent, dropping its players")
+            self._drop_node(node)
+
+    def _drop_node(self, node: int) -> None:
+        self._heard.pop(node, None)
+        members = self._members.pop(node, set())
+        if self.on_players and members:
+            self.on_players({}, list(members))
+
+    @abstractmethod
+    def _send(self, batch: dict) -> None:
+        """Hand a flushed batch to the other nodes."""
+
+    def _deliver(self, batch: dict) -> None:
+        node = batch["node"]
+        if node == self.node:
+            return
+        if batch.get("left"):
+            self._drop_node(node)
+            return
+        self._heard[node] = time.monotonic()
+        # JSON turns int keys into strings
+        players = {int(pid): p for pid, p in batch["players"].items()}
+        removed = [int(pid) for pid in batch["removed"]]
+        members = self._members.setdefault(node, set())
+        if batch.get("full"):
+            # Anything of theirs we hold that isn't listed is gone
+            removed.extend(pid for pid in members if pid not in players)
+            members.clear()
+        members.update(players)
+        members.difference_update(removed)
+        if self.on_players and (players or removed):
+            self.on_players(players, removed)
+        if self.on_chat:
+            for message in batch["chat"]:
+                self.on_chat(message)
+
+
+class InProcessBackbone(Backbone):
+    """Nodes sharing a hub (a plain list) in one process; the default for a single node."""
+    _hub: list["InProcessBackbone"]
+
+    def __init__(self, node: int, hub: list["InProcessBackbone"] | None = None):
+        super().__init__(node)
+        self._hub = hub if hub is not None else []
+        self._hub.append(self)
+
+    async def stop(self) -> None:
+        if self in self._hub:
+            self._hub.remove(self)
+
+    def _send(self, batch: dict) -> None:
+        for other in self._hub:
+            if other is not self:
+                other._deliver(batch)
+
+
+class BrokerBackbone(Backbone):
+    """Node side of server/broker.py, at tcp://host:port or unix:///path."""
+    url: str
+    _reader: asyncio.StreamReader | None
+    _writer: asyncio.StreamWriter | None
+    _task: asyncio.Task | None
+
+    def __init__(self, node: int, url: str):
+        super().__init__(node)
+        self.url = url
+        self._reader = None
+        self._writer = None
+        self._task = None
+
+    async def start(self) -> None:
+        self._reader, self._writer = await open_broker_connection(self.url)
+        self._task = asyncio.create_task(self._receive())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+        if self._writer:
+            self._writer.close()
+
+    def _send(self, batch: dict) -> None:
+        if self._writer is None or self._writer.is_closing():
+            return
+        data = json.dumps(batch).encode("utf-8")
+        self._writer.write(LENGTH.pack(len(data)) + data)
+
+    async def _receive(self) -> None:
+        assert self._reader is not None
+        try:
+            while True:
+                self._deliver(json.loads(await read_frame(self._reader)))
+        except asyncio.IncompleteReadError:
+            print("[Server] Lost connection to the broker")
+            # Nobody can tell us about the other nodes any more
+            for node in list(self._members):
+                self._drop_node(node)
+
+
+async def open_broker_connection(url: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    if url.startswith("unix://"):
+        return await asyncio.open_unix_connection(url[len("unix://"):])
+    host, _, port = url.removeprefix("tcp://").rpartition(":")
+    return await asyncio.open_connection(host or "127.0.0.1", int(port))
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return await reader.readexactly(length)
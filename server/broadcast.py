@@ -0,0 +1,137 @@
+import json
+import time
+import traceback
+
+from server.playerHandler import PlayerHandler
+from server.clientSession import ClientSession, Frame
+from server.metrics import METRICS
+from server import protocol
+
+
+def players_frame(handler: PlayerHandler, client: ClientSession, changed: dict,
+                  keyframe_due: bool, view_radius: float, near_radius: float | None = None,
+                  far_every: int = 1) -> Frame | None:
+    """
+    Build this tick's players frame for one client, or None if it has nothing new.
+
+    The client only hears about players on its map within view_radius. Legacy
+    clients get that full list every tick; delta clients get a players_delta with
+    only what entered, moved or left since the snapshot they hold, and a full
+    keyframe when they are out of sync or keyframe_due is set. With near_radius,
+    moves of players farther away only go out in every far_every-th delta.
+
+    Only the ids in `changed` are used; the frame is joined from each player's
+    cached fragment, so only players that changed get encoded again.
+    """
+    visible = handler.visible_ids(client.player_id, view_radius)
+    # A delta may only replace a delta the client will also receive,
+    # so a still-pending frame is superseded by a keyframe instead
+    if (client.delta and not keyframe_due and client.baseline_seq >= 0
+            and not client.position_pending):
+        entered = visible - client.known
+        left = client.known - visible
+        if len(changed) < len(visible):
+            moved = [pid for pid in changed if pid in visible and pid not in entered]
+        else:
+            moved = [pid for pid in visible if pid in changed and pid not in entered]
+        held = client.deferred
+        if near_radius is not None:
+            # Counted even when nothing goes out, so held moves can't wait forever
+            client.delta_ticks += 1
+            if client.delta_ticks % far_every == 0:
+                # Far frame: catch up on everything held back
+                moved.extend(pid for pid in held if pid in visible and pid not in entered and pid not in changed)
+                held.clear()
+            else:
+                moved = _near_only(handler, client.player_id, moved, near_radius, held)
+        if not entered and not left and not moved:
+            return None  # nothing this client can see has changed
+        moved.extend(entered)
+        started = time.perf_counter()
+        frame = _encode(handler, client, True, moved, list(left))
+    else:
+        client.deferred.clear()
+        started = time.perf_counter()
+        frame = _encode(handler, client, False, visible, [])
+    METRICS.encode_time.observe(time.perf_counter() - started)
+    client.seq += 1
+    client.baseline_seq = client.seq
+    client.known = visible
+    return frame
+
+
+def frame_failed(client: ClientSession) -> None:
+    """
+    Call from the except block of a players_frame() that raised: it is counted
+    in METRICS (only the first traceback is printed, not one per client per
+    tick) and the client gets a keyframe next time.
+    """
+    METRICS.frame_errors += 1
+    if METRICS.frame_errors == 1:
+        traceback.print_exc()
+    client.baseline_seq = -1
+
+
+def _encode(handler: PlayerHandler, client: ClientSession, delta: bool, ids, removed: list[int]) -> Frame:
+    """
+    players_delta (delta=True) or players_update frame for the client's next seq,
+    holding the players in `ids`: binary from the players' cached records when the
+    client negotiated it and every record could be packed, otherwise JSON joined
+    from their cached fragments.
+    """
+    players = [handler.players[pid] for pid in ids]
+    seq = client.seq + 1
+    base = client.baseline_seq if delta else -1
+    timestamp = time.time()
+    if client.binary:
+        records = [p.record() for p in players]
+        if all(records):
+            kind = protocol.KIND_PLAYERS_DELTA if delta else protocol.KIND_PLAYERS_UPDATE
+            return protocol.assemble_players(kind, seq, base, timestamp, records, removed)
+    body = ", ".join([p.fragment() for p in players])
+    if delta:
+        return (f'{{"type": "players_delta", "seq": {seq}, "base": {base}, "changed": {{{body}}}, '
+                f'"removed": {json.dumps(removed)}, "timestamp": {timestamp!r}}}')
+    return f'{{"type": "players_update", "players": {{{body}}}, "seq": {seq}, "timestamp": {timestamp!r}}}'
+
+
+def _near_only(handler: PlayerHandler, pid: int, moved: list[int], radius: float,
+               held: set[int]) -> list[int]:
+    """Those of `moved` within radius of pid; the rest are added to `held`."""
+    near, far = handler.split_by_distance(pid, moved, radius)
+    held.update(far)
+    return near
+
+
+def apply_player_message(handler: PlayerHandler, session: ClientSession, data: dict) -> bool:
+    """Handle the position/sync messages of a client; False if `data` is something else."""
+    msg_type = data.get("type")
+
+    if msg_type == "player_update":
+        # Update player position - use server-assigned ID, ignore client ID
+        x = float(data.get("x", 0))
+        y = float(data.get("y", 0))
+        # Rejected here, before it can reach the tick (an error frame goes back to the client)
+        protocol.check_position(x, y)
+        map_name = str(data.get("map", ""))
+        direction = str(data.get("direction", "DOWN"))
+
+        # Use the server-assigned player_id, not client-provided
+        # HINT: This part might be helpful for direction change
+        # Maybe you can add other parameters?
+        # Only the latest one per tick is applied, see PlayerHandler.apply_pending
+        handler.submit(session.player_id, x, y, map_name, direction)
+
+    elif msg_type == "hello":
+        # Client capabilities; switching mode always starts from a keyframe
+        features = data.get("features", [])
+        session.delta = "delta" in features
+        session.baseline_seq = -1
+
+    elif msg_type == "players_resync":
+        # Client missed a delta, send it a keyframe on the next tick
+        session.baseline_seq = -1
+
+    else:
+        return False
+    return True
@@ -0,0 +1,60 @@
+"""
+Minimal message broker for BrokerBackbone: every frame a node sends is relayed
+as-is to all the other connected nodes. When a node disconnects, the others get
+a {"node": N, "left": true} batch so they drop its players right away.
+
+    python -m server.broker --port 8990
+    python -m server.broker --unix /tmp/i2p-broker.sock
+"""
+import argparse
+import asyncio
+import json
+
+from server.backbone import LENGTH, read_frame
+
+NODES: set[asyncio.StreamWriter] = set()
+
+
+async def handle_node(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    NODES.add(writer)
+    print(f"[Broker] Node connected ({len(NODES)} total)")
+    # Learned from its first batch, to tell the others when it leaves
+    node = None
+    try:
+        while True:
+            data = await read_frame(reader)
+            if node is None:
+                node = json.loads(data).get("node")
+            frame = LENGTH.pack(len(data)) + data
+            for other in NODES:
+                if other is not writer:
+                    other.write(frame)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        NODES.discard(writer)
+        writer.close()
+        if node is not None:
+            data = json.dumps({"node": node, "left": True}).encode("utf-8")
+            for other in NODES:
+                other.write(LENGTH.pack(len(data)) + data)
+        print(f"[Broker] Node {node} disconnected ({len(NODES)} total)")
+
+
+async def main(port: int, unix_path: str | None) -> None:
+    if unix_path:
+        server = await asyncio.start_unix_server(handle_node, unix_path)
+        print(f"[Broker] Listening on unix://{unix_path}")
+    else:
+        server = await asyncio.start_server(handle_node, "0.0.0.0", port)
+        print(f"[Broker] Listening on tcp://0.0.0.0:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pub/sub broker for multi-node servers")
+    parser.add_argument("--port", type=int, default=8990)
+    parser.add_argument("--unix", default=None, help="listen on a Unix socket path instead of TCP")
+    args = parser.parse_args()
+    asyncio.run(main(args.port, args.unix))
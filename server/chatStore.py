@@ -0,0 +1,108 @@
+import json
+import time
+
+# Messages kept for backfill; older ones are overwritten
+CHAT_CAPACITY = 1024
+# Backfill sizes for a fresh client / a client catching up from an id
+RECENT_LIMIT = 100
+SINCE_LIMIT = 200
+MAX_TEXT_LENGTH = 200
+# "map" and "proximity" messages only reach players on the sender's map / near the sender
+CHAT_CHANNELS = ("global", "map", "proximity")
+
+
+class ChatEntry:
+    """One chat message; its JSON encoding is built once and reused for every send."""
+    __slots__ = ("id", "sender", "text", "ts", "channel", "map", "encoded")
+
+    id: int
+    sender: int
+    text: str
+    ts: float
+    channel: str
+    # Sender's map when it was sent, for the map/proximity channels
+    map: str
+    encoded: str
+
+    def __init__(self, id: int, sender: int, text: str, ts: float, channel: str = "global", map: str = ""):
+        self.id = id
+        self.sender = sender
+        self.text = text
+        self.ts = ts
+        self.channel = channel
+        self.map = map
+        self.encoded = json.dumps(self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "from": self.sender,
+            "text": self.text,
+            "ts": self.ts,
+            "channel": self.channel,
+        }
+
+
+class ChatStore:
+    """
+    Fixed-capacity ring buffer of chat messages. Ids are consecutive, so message
+    `id` lives in slot id % capacity and list_since() is a direct slice with no
+    scanning. Only used from the server's event loop, so it takes no lock.
+    """
+    _capacity: int
+    _next_id: int
+    _ring: list[ChatEntry | None]
+
+    def __init__(self, capacity: int = CHAT_CAPACITY) -> None:
+        self._capacity = capacity
+        self._next_id = 1
+        self._ring = [None] * capacity
+
+    def __len__(self) -> int:
+        return min(self._next_id - 1, self._capacity)
+
+    def add(self, sender_id: int, text: str, channel: str = "global", map_name: str = "") -> ChatEntry:
+        # Sanitize
+        t = (text or "").strip()
+        if len(t) > MAX_TEXT_LENGTH:
+            t = t[:MAX_TEXT_LENGTH]
+        if not t:
+            raise ValueError("empty")
+        if channel not in CHAT_CHANNELS:
+            channel = "global"
+        entry = ChatEntry(self._next_id, sender_id, t, time.time(), channel, map_name)
+        self._ring[entry.id % self._capacity] = entry
+        self._next_id += 1
+        return entry
+
+    def list_since(self, since_id: int) -> list[ChatEntry]:
+        """Messages with id > since_id still in the buffer, capped to the newest few (all channels)."""
+        if since_id <= 0:
+            first = self._next_id - RECENT_LIMIT  # cap response size
+        else:
+            first = max(since_id + 1, self._next_id - SINCE_LIMIT)
+        first = max(first, self._next_id - self._capacity, 1)
+        ring = self._ring
+        cap = self._capacity
+        return [ring[i % cap] for i in range(first, self._next_id)]
+
+    def dump(self) -> list[list]:
+        """Every buffered message as plain lists, oldest first, for a snapshot."""
+        first = max(self._next_id - self._capacity, 1)
+        ring = self._ring
+        cap = self._capacity
+        return [
+            [e.id, e.sender, e.text, e.ts, e.channel, e.map]
+            for e in (ring[i % cap] for i in range(first, self._next_id))
+        ]
+
+    def restore(self, messages: list[list]) -> None:
+        """Refill an empty store from dump() output; ids carry on after the last one."""
+        for mid, sender, text, ts, channel, map_name in messages:
+            self._ring[mid % self._capacity] = ChatEntry(mid, sender, text, ts, channel, map_name)
+            self._next_id = max(self._next_id, mid + 1)
+
+
+def encode_chat_update(entries: list[ChatEntry]) -> str:
+    """chat_update frame assembled from the cached per-message JSON."""
+    return '{"type": "chat_update", "messages": [' + ", ".join(e.encoded for e in entries) + "]}"
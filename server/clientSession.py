@@ -0,0 +1,125 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from server.admission import ConnectionLimits
+from server.metrics import METRICS
+
+# Reliable frames (chat, control) a client may fall behind by before we drop it
+MAX_RELIABLE_QUEUE = 256
+
+Frame = str | bytes
+
+
+@dataclass(eq=False)
+class ClientSession:
+    """
+    Per-connection state kept by the server next to the websocket.
+
+    Outgoing frames are never awaited by the caller: they are queued here and a
+    per-connection writer task drains them, so a slow socket only delays itself.
+    Position frames are latest-wins (a single pending slot), everything else is
+    delivered in order from a bounded queue.
+    """
+    websocket: Any
+    player_id: int = -1
+    # Client asked for players_delta frames instead of full players_update
+    delta: bool = False
+    # Negotiated the binary subprotocol for position frames
+    binary: bool = False
+    # Last players frame sequence sent to this client
+    seq: int = 0
+    # Snapshot sequence the client currently holds (-1 = needs a keyframe)
+    baseline_seq: int = -1
+    # Player ids inside the client's area of interest as of baseline_seq
+    known: set[int] = field(default_factory=set)
+    # Chat channels the client receives (see server.chatStore.CHAT_CHANNELS)
+    chat_channels: set[str] = field(default_factory=lambda: {"global"})
+    # Adaptive pacing (see server.adaptiveRate): seconds between players frames,
+    # when the next one may go out, and the ChangeLog tick the last one covered
+    send_interval: float = 0.0
+    next_send: float = 0.0
+    last_tick: int = 0
+    # A keyframe came due while this client was being skipped
+    keyframe_owed: bool = False
+    # Far-away players whose moves are held back until the next far frame,
+    # and the deltas built for this client so far (sent or not), which pace those frames
+    deferred: set[int] = field(default_factory=set)
+    delta_ticks: int = 0
+    # Inbound rate limits (see server.admission)
+    limits: ConnectionLimits = field(default_factory=lambda: ConnectionLimits(time.monotonic()))
+
+    _reliable: deque[Frame] = field(default_factory=deque)
+    _position: Frame | None = None
+    _wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    _closed: bool = False
+
+    @property
+    def position_pending(self) -> bool:
+        """A position frame is still waiting, so a new one will replace it."""
+        return self._position is not None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def rtt(self) -> float:
+        """Round-trip time from the websocket's keepalive pings (0 until the first pong)."""
+        return getattr(self.websocket, "latency", 0.0) or 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Frames waiting to go out."""
+        return len(self._reliable) + (self._position is not None)
+
+    def send(self, frame: Frame) -> None:
+        """Queue a frame for guaranteed, in-order delivery."""
+        if self._closed:
+            return
+        if len(self._reliable) >= MAX_RELIABLE_QUEUE:
+            # Guaranteed frames can't be dropped, so a client this far behind is cut off
+            METRICS.queue_overflows += 1
+            self.close()
+            return
+        self._reliable.append(frame)
+        self._wakeup.set()
+
+    def send_position(self, frame: Frame) -> bool:
+        """Queue a position frame, replacing any that has not gone out yet (returns True if so)."""
+        if self._closed:
+            return False
+        replaced = self._position is not None
+        if replaced:
+            METRICS.positions_replaced += 1
+        self._position = frame
+        self._wakeup.set()
+        return replaced
+
+    def close(self, code: int = 1013, reason: str = "send queue overflow") -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        asyncio.get_running_loop().create_task(self.websocket.close(code, reason))
+
+    async def run_writer(self) -> None:
+        """Drain queued frames to the socket until the connection goes away."""
+        try:
+            while not self._closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while not self._closed:
+                    if self._reliable:
+                        frame = self._reliable.popleft()
+                    elif self._position is not None:
+                        frame = self._position
+                        self._position = None
+                    else:
+                        break
+                    await self.websocket.send(frame)
+                    METRICS.count_sent(frame)
+        except Exception:
+            self._closed = True
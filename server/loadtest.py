@@ -0,0 +1,334 @@
+"""
+Headless bot swarm for load-testing server.py.
+
+Every bot is a plain asyncio WebSocket client speaking the same protocol as
+OnlineManager (binary subprotocol, delta hello, player_update, chat_send). Bots
+random-walk the walkable tiles of the real TMX maps, take the save file's
+teleporters to other maps and chat at the given rates.
+
+    python server.py &
+    python -m server.loadtest --bots 500 --duration 60 --server-pid $!
+
+Reported: time to connect and register, inter-arrival time of the players
+frames (and its jitter), end-to-end update latency (one bot's player_update
+until another bot sees that position), bytes per second both ways and, with
+--server-pid on Linux, the server's CPU usage.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pytmx
+import websockets
+
+from server import protocol
+
+ROOT = Path(__file__).resolve().parent.parent
+MAPS_DIR = ROOT / "assets" / "maps"
+SAVE_FILE = ROOT / "saves" / "game0.json"
+# Same as GameSettings.TILE_SIZE and Player.speed on the client
+TILE_SIZE = 64
+WALK_SPEED = 4.0 * TILE_SIZE
+# Positions a bot's update may be off by after binary encoding
+POSITION_TOLERANCE = 1.0 / protocol.COORD_SCALE
+# Unseen updates remembered per bot (about 2 s at the default send rate), so a
+# frame a few sends behind still matches the update it carries
+IN_FLIGHT_HISTORY = 64
+
+
+@dataclass
+class BotMap:
+    name: str
+    # Tiles a player can stand on, and the pixel spawn point used when arriving
+    walkable: set[tuple[int, int]]
+    spawn: tuple[float, float]
+    # Teleporter tile -> destination map
+    teleports: dict[tuple[int, int], str]
+
+
+def load_maps() -> dict[str, BotMap]:
+    """Walkable tiles of every map in the save file, by the same rules as Map."""
+    save = json.loads(SAVE_FILE.read_text())
+    maps: dict[str, BotMap] = {}
+    for entry in save["map"]:
+        # No image loader: only the layer data is needed
+        tmx = pytmx.TiledMap(str(MAPS_DIR / entry["path"]))
+        floor: set[tuple[int, int]] = set()
+        blocked: set[tuple[int, int]] = set()
+        for layer in tmx.visible_layers:
+            if not isinstance(layer, pytmx.TiledTileLayer):
+                continue
+            solid = "collision" in layer.name.lower() or "house" in layer.name.lower()
+            for x, y, gid in layer:
+                if gid:
+                    (blocked if solid else floor).add((x, y))
+        spawn = (entry["player"]["x"] * TILE_SIZE, entry["player"]["y"] * TILE_SIZE)
+        teleports = {(int(t["x"]), int(t["y"])): t["destination"] for t in entry["teleport"]}
+        maps[entry["path"]] = BotMap(entry["path"], floor - blocked, spawn, teleports)
+    return maps
+
+
+@dataclass
+class Stats:
+    """Samples shared by every bot; all bots run on one event loop."""
+    connect_times: list[float] = field(default_factory=list)
+    connected: int = 0
+    connect_failures: int = 0
+    disconnects: int = 0
+    inter_arrival: list[float] = field(default_factory=list)
+    latencies: list[float] = field(default_factory=list)
+    bytes_in: int = 0
+    bytes_out: int = 0
+    frames_in: int = 0
+    resyncs: int = 0
+    chats_in: int = 0
+    # pid -> (x, y, map, send time) of each bot's updates nobody has seen yet, oldest first
+    in_flight: dict[int, collections.deque[tuple[float, float, str, float]]] = field(default_factory=dict)
+
+    def reset_rates(self) -> None:
+        self.inter_arrival.clear()
+        self.latencies.clear()
+        self.bytes_in = self.bytes_out = self.frames_in = self.chats_in = 0
+
+
+class Bot:
+    def __init__(self, url: str, maps: dict[str, BotMap], stats: Stats, args: argparse.Namespace):
+        self.url = url
+        self.maps = maps
+        self.stats = stats
+        self.args = args
+        self.player_id = -1
+        self.map = random.choice(list(maps.values()))
+        self.tile = random.choice(list(self.map.walkable))
+        self.x = float(self.tile[0] * TILE_SIZE)
+        self.y = float(self.tile[1] * TILE_SIZE)
+        self.direction = "DOWN"
+        self.seq = -1
+        self.last_frame = 0.0
+
+    async def run(self, stop: asyncio.Event) -> None:
+        started = time.perf_counter()
+        try:
+            ws = await websockets.connect(self.url, subprotocols=[protocol.BINARY_SUBPROTOCOL])
+        except (OSError, websockets.exceptions.WebSocketException):
+            self.stats.connect_failures += 1
+            return
+        binary = ws.subprotocol == protocol.BINARY_SUBPROTOCOL
+        try:
+            # Hello first, like OnlineManager: the server registers us once it arrives
+            await self._send(ws, json.dumps({"type": "hello", "features": ["delta"]}))
+            registered = json.loads(await ws.recv())
+            self.player_id = int(registered["id"])
+            self.stats.connect_times.append(time.perf_counter() - started)
+            self.stats.connected += 1
+            receiver = asyncio.create_task(self._receive(ws))
+            try:
+                await self._walk(ws, binary, stop)
+            finally:
+                receiver.cancel()
+        except websockets.exceptions.ConnectionClosed:
+            self.stats.disconnects += 1
+        finally:
+            if self.player_id >= 0:
+                self.stats.connected -= 1
+            self.stats.in_flight.pop(self.player_id, None)
+            await ws.close()
+
+    async def _send(self, ws, frame: str | bytes) -> None:
+        self.stats.bytes_out += len(frame)
+        await ws.send(frame)
+
+    async def _walk(self, ws, binary: bool, stop: asyncio.Event) -> None:
+        interval = 1.0 / self.args.send_rate
+        target = self.tile
+        while not stop.is_set():
+            await asyncio.sleep(interval * random.uniform(0.9, 1.1))
+            if random.random() < self.args.chat_rate * interval:
+                await self._send(ws, json.dumps({
+                    "type": "chat_send",
+                    "text": f"bot {self.player_id} says hi",
+                    "channel": random.choice(("global", "map", "proximity"))
+                }))
+            if random.random() < self.args.teleport_rate * interval:
+                self._teleport(random.choice([m for m in self.maps if m != self.map.name]))
+                target = self.tile
+            else:
+                target = self._step(target, WALK_SPEED * interval)
+            now = time.perf_counter()
+            sends = self.stats.in_flight.get(self.player_id)
+            if sends is None:
+                sends = self.stats.in_flight[self.player_id] = collections.deque(maxlen=IN_FLIGHT_HISTORY)
+            sends.append((self.x, self.y, self.map.name, now))
+            frame = protocol.encode_player_update(self.x, self.y, self.map.name, self.direction) if binary else None
+            if frame is None:
+                frame = json.dumps({
+                    "type": "player_update",
+                    "x": self.x, "y": self.y, "map": self.map.name, "direction": self.direction
+                })
+            await self._send(ws, frame)
+
+    def _step(self, target: tuple[int, int], distance: float) -> tuple[int, int]:
+        """Move toward target; on arrival pick a random walkable neighbour as the next one."""
+        tx, ty = target[0] * TILE_SIZE, target[1] * TILE_SIZE
+        dx, dy = tx - self.x, ty - self.y
+        if abs(dx) + abs(dy) <= distance:
+            self.x, self.y = float(tx), float(ty)
+            self.tile = target
+            destination = self.map.teleports.get(target)
+            if destination in self.maps and random.random() < 0.5:
+                self._teleport(destination)
+                return self.tile
+            x, y = target
+            options = [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+            options = [t for t in options if t in self.map.walkable]
+            return random.choice(options) if options else target
+        if dx:
+            self.x += max(-distance, min(distance, dx))
+            self.direction = "RIGHT" if dx > 0 else "LEFT"
+        else:
+            self.y += max(-distance, min(distance, dy))
+            self.direction = "DOWN" if dy > 0 else "UP"
+        return target
+
+    def _teleport(self, map_name: str) -> None:
+        self.map = self.maps[map_name]
+        self.x, self.y = self.map.spawn
+        self.tile = (int(self.x // TILE_SIZE), int(self.y // TILE_SIZE))
+
+    async def _receive(self, ws) -> None:
+        try:
+            await self._read(ws)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def _read(self, ws) -> None:
+        stats = self.stats
+        async for message in ws:
+            now = time.perf_counter()
+            stats.bytes_in += len(message)
+            data = protocol.decode_frame(message) if isinstance(message, bytes) else json.loads(message)
+            msg_type = data.get("type")
+            if msg_type == "chat_update":
+                stats.chats_in += len(data.get("messages", []))
+                continue
+            if msg_type == "players_update":
+                players = data.get("players", {})
+            elif msg_type == "players_delta":
+                players = data.get("changed", {})
+                if data.get("base") != self.seq:
+                    stats.resyncs += 1
+                    await self._send(ws, json.dumps({"type": "players_resync"}))
+            else:
+                continue
+            self.seq = data.get("seq", self.seq)
+            stats.frames_in += 1
+            if self.last_frame:
+                stats.inter_arrival.append(now - self.last_frame)
+            self.last_frame = now
+            for pid, p in players.items():
+                sends = stats.in_flight.get(int(pid))
+                if sends:
+                    self._match(sends, p, now)
+
+    def _match(self, sends: collections.deque, p: dict, now: float) -> None:
+        """Record the latency of the earliest unseen update p shows; it and the ones before are done."""
+        x = float(p["x"])
+        y = float(p["y"])
+        for i, (sx, sy, map_name, sent) in enumerate(sends):
+            if (p.get("map") == map_name and abs(x - sx) <= POSITION_TOLERANCE
+                    and abs(y - sy) <= POSITION_TOLERANCE):
+                self.stats.latencies.append(now - sent)
+                for _ in range(i + 1):
+                    sends.popleft()
+                return
+
+
+# ------------------------------
+# Reporting
+# ------------------------------
+def percentiles(samples: list[float]) -> str:
+    if not samples:
+        return "no samples"
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return f"p50 {pick(0.50):.1f} ms  p90 {pick(0.90):.1f} ms  p99 {pick(0.99):.1f} ms  max {ordered[-1] * 1000:.1f} ms"
+
+
+def cpu_seconds(pid: int) -> float | None:
+    """User + system CPU time of a process from /proc (Linux only)."""
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def report(stats: Stats, server_pid: int | None, interval: float, stop: asyncio.Event) -> None:
+    last_cpu = cpu_seconds(server_pid) if server_pid else None
+    last_own_cpu = time.process_time()
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - started
+        gaps = stats.inter_arrival
+        print(f"--- {stats.connected} bots connected, {stats.connect_failures} failed, {stats.disconnects} dropped")
+        print(f"connect:   {percentiles(stats.connect_times)}")
+        print(f"latency:   {percentiles(stats.latencies)}")
+        print(f"arrival:   {percentiles(gaps)}"
+              + (f"  jitter {statistics.pstdev(gaps) * 1000:.1f} ms" if len(gaps) > 1 else ""))
+        print(f"traffic:   in {stats.bytes_in / elapsed / 1024:.1f} KiB/s ({stats.frames_in / elapsed:.0f} frames/s)"
+              f"  out {stats.bytes_out / elapsed / 1024:.1f} KiB/s  chat {stats.chats_in / elapsed:.0f} msg/s"
+              f"  resyncs {stats.resyncs}")
+        # A saturated load generator measures itself, not the server
+        own_cpu = time.process_time()
+        line = f"cpu:       bots {(own_cpu - last_own_cpu) / elapsed * 100:.0f}%"
+        last_own_cpu = own_cpu
+        if server_pid:
+            cpu = cpu_seconds(server_pid)
+            if cpu is not None and last_cpu is not None:
+                line += f"  server {(cpu - last_cpu) / elapsed * 100:.0f}%"
+            last_cpu = cpu
+        print(line)
+        stats.reset_rates()
+
+
+async def main(args: argparse.Namespace) -> None:
+    maps = load_maps()
+    stats = Stats()
+    stop = asyncio.Event()
+    bots = [Bot(args.url, maps, stats, args) for _ in range(args.bots)]
+    tasks = []
+    reporter = asyncio.create_task(report(stats, args.server_pid, args.report_interval, stop))
+    # Ramp up so the connect times measure the server rather than a SYN flood
+    for bot in bots:
+        tasks.append(asyncio.create_task(bot.run(stop)))
+        await asyncio.sleep(1.0 / args.connect_rate)
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await reporter
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bot swarm load test for the Monster Go server")
+    parser.add_argument("--url", default="ws://127.0.0.1:8989")
+    parser.add_argument("--bots", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run after all bots started")
+    parser.add_argument("--connect-rate", type=float, default=200.0, help="new connections per second")
+    parser.add_argument("--send-rate", type=float, default=30.0, help="player_update messages per bot per second")
+    parser.add_argument("--chat-rate", type=float, default=0.05, help="chat messages per bot per second")
+    parser.add_argument("--teleport-rate", type=float, default=0.01, help="random map changes per bot per second")
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    parser.add_argument("--server-pid", type=int, default=None, help="report this process's CPU usage (Linux)")
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,180 @@
+"""
+Server metrics, served as JSON over plain HTTP on a side port.
+
+Counters are plain ints and lists bumped from the event loop, which is the only
+thread touching them, so recording a sample costs a dict lookup and an add and
+takes no lock. Everything that can be read off existing state (clients, players
+per map, queue depths, chat size) is gathered only when /metrics is scraped.
+"""
+import asyncio
+import bisect
+import json
+import time
+from typing import Any, Callable
+
+from server import protocol
+
+# Upper bounds of the histogram buckets, in milliseconds (plus an overflow bucket)
+TICK_BUCKETS_MS = (1.0, 2.0, 4.0, 8.0, 16.0, 33.0, 66.0, 133.0)
+ENCODE_BUCKETS_MS = (0.01, 0.03, 0.1, 0.3, 1.0, 3.0, 10.0)
+
+_BINARY_TYPES = {
+    protocol.KIND_PLAYER_UPDATE: "player_update",
+    protocol.KIND_PLAYERS_UPDATE: "players_update",
+    protocol.KIND_PLAYERS_DELTA: "players_delta",
+}
+# Every JSON frame we build starts with its "type" field
+_TYPE_PREFIX = '{"type": "'
+# Message types our clients send; anything else a client makes up is counted as "other"
+CLIENT_TYPES = frozenset({"hello", "player_update", "players_resync", "chat_send", "chat_subscribe", "ping"})
+
+
+class Histogram:
+    bounds: tuple[float, ...]
+    counts: list[int]
+    count: int
+    total: float
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000.0
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets_ms": list(self.bounds) + ["inf"],
+            "counts": self.counts,
+            "count": self.count,
+            "sum_ms": round(self.total, 3),
+        }
+
+
+class Metrics:
+    tick_duration: Histogram
+    # Current broadcast rate, which LoadGovernor may have lowered
+    tick_rate: float
+    tick_overruns: int
+    ticks_skipped: int
+    encode_time: Histogram
+    # type -> [messages, bytes]
+    received: dict[str, list[int]]
+    sent: dict[str, list[int]]
+    # Position frames replaced before they went out, clients cut off for falling behind
+    positions_replaced: int
+    queue_overflows: int
+    # Inbound messages dropped by rate limiting, by type (see server.admission)
+    dropped: dict[str, int]
+    # Clients turned away at the connection limit, cut off for flooding, or for an oversized message
+    connections_rejected: int
+    rate_limit_disconnects: int
+    oversize_disconnects: int
+    # players_frame() calls that raised (see server.broadcast.frame_failed)
+    frame_errors: int
+    started: float
+
+    def __init__(self):
+        self.tick_duration = Histogram(TICK_BUCKETS_MS)
+        self.tick_rate = 0.0
+        self.tick_overruns = 0
+        self.ticks_skipped = 0
+        self.encode_time = Histogram(ENCODE_BUCKETS_MS)
+        self.received = {}
+        self.sent = {}
+        self.positions_replaced = 0
+        self.queue_overflows = 0
+        self.dropped = {}
+        self.connections_rejected = 0
+        self.rate_limit_disconnects = 0
+        self.oversize_disconnects = 0
+        self.frame_errors = 0
+        self.started = time.time()
+
+    def count_received(self, msg_type: str, size: int) -> None:
+        msg_type = client_type(msg_type)
+        entry = self.received.get(msg_type)
+        if entry is None:
+            entry = self.received[msg_type] = [0, 0]
+        entry[0] += 1
+        entry[1] += size
+
+    def count_sent(self, frame: str | bytes) -> None:
+        msg_type = frame_type(frame)
+        entry = self.sent.get(msg_type)
+        if entry is None:
+            entry = self.sent[msg_type] = [0, 0]
+        entry[0] += 1
+        entry[1] += len(frame)
+
+    def to_dict(self) -> dict:
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "tick_duration": self.tick_duration.to_dict(),
+            "tick_rate": round(self.tick_rate, 1),
+            "tick_overruns": self.tick_overruns,
+            "ticks_skipped": self.ticks_skipped,
+            "encode_time": self.encode_time.to_dict(),
+            "received": {t: {"messages": n, "bytes": b} for t, (n, b) in self.received.items()},
+            "sent": {t: {"messages": n, "bytes": b} for t, (n, b) in self.sent.items()},
+            "positions_replaced": self.positions_replaced,
+            "queue_overflows": self.queue_overflows,
+            "dropped": self.dropped,
+            "connections_rejected": self.connections_rejected,
+            "rate_limit_disconnects": self.rate_limit_disconnects,
+            "oversize_disconnects": self.oversize_disconnects,
+            "frame_errors": self.frame_errors,
+        }
+
+
+def frame_type(frame: str | bytes) -> str:
+    """Message type of an outgoing frame, without parsing it."""
+    if isinstance(frame, bytes):
+        return _BINARY_TYPES.get(frame[0], "binary")
+    if frame.startswith(_TYPE_PREFIX):
+        end = frame.find('"', len(_TYPE_PREFIX))
+        if end > 0:
+            return frame[len(_TYPE_PREFIX):end]
+    return "other"
+
+
+def client_type(msg_type: str) -> str:
+    """Metric key of an inbound message type, so clients can't add keys without bound."""
+    return msg_type if msg_type in CLIENT_TYPES else "other"
+
+
+# One per process; shard and worker processes each keep their own
+METRICS = Metrics()
+
+
+async def serve_metrics(port: int, collect: Callable[[], dict[str, Any]]) -> asyncio.Server:
+    """
+    Answer GET /metrics on `port` with METRICS plus whatever collect() returns.
+    Minimal HTTP/1.0: one response per connection.
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5.0)
+            path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+            if path in (b"/", b"/metrics"):
+                body = json.dumps({**METRICS.to_dict(), **collect()}).encode("utf-8")
+                status = b"200 OK"
+            else:
+                body = b'{"error": "not_found"}'
+                status = b"404 Not Found"
+            writer.write(
+                b"HTTP/1.0 " + status + b"\r\nContent-Type: application/json\r\n"
+                + b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "0.0.0.0", port)
@@ -0,0 +1,313 @@
+"""
+WebSocket proxy that puts a bad network between OnlineManager and server.py.
+
+Every frame is held back by a latency with jitter (normally distributed, never
+reordered: WebSockets run over TCP), queued behind the frames before it on a
+link with limited bandwidth, and can be frozen by a stall. A forced disconnect
+drops every proxied connection at once, the way a lost network would, so the
+client reconnects and resumes. Conditions are set per direction ("up" is
+client -> server, "down" is server -> client) from the command line or by a
+scenario script, and the proxy reports the delay it added per direction.
+
+The client always connects to port 8989, so move the server aside:
+
+    python server.py --port 9000 &
+    python -m server.netsim --upstream ws://127.0.0.1:9000 --latency 80 --jitter 20
+    python main.py
+
+A scenario is a JSON list of steps, each run `at` seconds after start:
+
+    [
+        {"at": 0, "latency": 50, "jitter": 10},
+        {"at": 10, "down": {"bandwidth": 2000}},
+        {"at": 20, "stall": 3},
+        {"at": 30, "disconnect": true},
+        {"at": 40, "latency": 0, "jitter": 0, "bandwidth": 0}
+    ]
+
+latency and jitter are in milliseconds, bandwidth in bytes per second (0 means
+unlimited) and stall in seconds; top-level values apply to both directions,
+"up" and "down" to one. --record writes one CSV row per forwarded frame with
+its connection, direction, type, size and when the proxy got and sent it.
+
+The proxy answers WebSocket pings itself, so keepalive doesn't see the delay,
+and an upstream refusing the connection (e.g. 503 when full) reaches the client
+as close code 1013 rather than as the HTTP status.
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+from websockets.frames import CloseCode
+
+from server import protocol
+from server.loadtest import percentiles
+
+LISTEN_PORT = 8989
+UPSTREAM_URL = "ws://127.0.0.1:9000"
+DIRECTIONS = ("up", "down")
+# Close codes that mean the connection just went away; the other side is dropped the same way
+ABNORMAL_CLOSES = (None, CloseCode.NO_STATUS_RCVD, CloseCode.ABNORMAL_CLOSURE)
+
+FRAME_KINDS = {
+    protocol.KIND_PLAYER_UPDATE: "player_update",
+    protocol.KIND_PLAYERS_UPDATE: "players_update",
+    protocol.KIND_PLAYERS_DELTA: "players_delta",
+}
+
+
+def message_type(message: str | bytes) -> str:
+    if isinstance(message, bytes):
+        return FRAME_KINDS.get(message[0], "binary") if message else "binary"
+    try:
+        return str(json.loads(message).get("type", "?"))
+    except (ValueError, AttributeError):
+        return "?"
+
+
+@dataclass
+class Conditions:
+    """What one direction of every connection goes through."""
+    # Seconds
+    latency: float = 0.0
+    jitter: float = 0.0
+    # Bytes per second, 0 for unlimited
+    bandwidth: float = 0.0
+
+
+@dataclass
+class LinkStats:
+    frames: int = 0
+    bytes: int = 0
+    delays: list[float] = field(default_factory=list)
+
+    def reset(self) -> None:
+        self.frames = self.bytes = 0
+        self.delays.clear()
+
+
+class Link:
+    """One direction of one proxied connection."""
+    def __init__(self, sim: "NetSim", conn_id: int, direction: str, target: Any):
+        self.sim = sim
+        self.conn_id = conn_id
+        self.direction = direction
+        self.target = target
+        # (deliver at, received at, frame), in delivery order
+        self.queue: asyncio.Queue[tuple[float, float, str | bytes]] = asyncio.Queue()
+        # When the frame before the next one has gone through the bandwidth limit, and is delivered
+        self._busy_until = 0.0
+        self._last_delivery = 0.0
+
+    def push(self, message: str | bytes) -> None:
+        now = time.monotonic()
+        conditions = self.sim.conditions[self.direction]
+        start = max(now, self._busy_until)
+        self._busy_until = start + (len(message) / conditions.bandwidth if conditions.bandwidth > 0 else 0.0)
+        delay = max(0.0, self.sim.rng.gauss(conditions.latency, conditions.jitter))
+        self._last_delivery = max(self._busy_until + delay, self._last_delivery)
+        self.queue.put_nowait((self._last_delivery, now, message))
+
+    async def pump(self) -> None:
+        while True:
+            deliver_at, received, message = await self.queue.get()
+            # Re-check after every sleep: a stall may start or grow meanwhile
+            while (wait := max(deliver_at, self.sim.stalled_until) - time.monotonic()) > 0:
+                await asyncio.sleep(wait)
+            await self.target.send(message)
+            self.sim.delivered(self, received, message)
+            self.queue.task_done()
+
+
+class NetSim:
+    def __init__(self, upstream: str, seed: Optional[int], record: Optional[str]):
+        self.upstream = upstream
+        self.rng = random.Random(seed)
+        self.conditions = {d: Conditions() for d in DIRECTIONS}
+        self.stalled_until = 0.0
+        self.stats = {d: LinkStats() for d in DIRECTIONS}
+        self.started = time.monotonic()
+        self._ids = itertools.count(1)
+        # conn id -> (client, upstream, links)
+        self._connections: dict[int, tuple[Any, Any, list[Link]]] = {}
+        self._record_file = open(record, "w", newline="") if record else None
+        self._record = csv.writer(self._record_file) if self._record_file else None
+        if self._record:
+            self._record.writerow(["conn", "direction", "type", "bytes", "received", "sent"])
+
+    # -----------------------------
+    # Conditions
+    # -----------------------------
+    def apply(self, step: dict) -> None:
+        """Apply one scenario step (same keys as in the module docstring)."""
+        for direction in DIRECTIONS:
+            values = {k: step[k] for k in ("latency", "jitter", "bandwidth") if k in step}
+            values.update(step.get(direction, {}))
+            conditions = self.conditions[direction]
+            for key, value in values.items():
+                setattr(conditions, key, float(value) / 1000 if key in ("latency", "jitter") else float(value))
+        if step.get("stall"):
+            self.stalled_until = max(self.stalled_until, time.monotonic() + float(step["stall"]))
+        if step.get("disconnect"):
+            self.disconnect_all()
+        print(f"[NetSim] {time.monotonic() - self.started:.1f}s: {self.describe()}"
+              + (f", stalled {step['stall']}s" if step.get("stall") else "")
+              + (f", dropped {len(self._connections)} connections" if step.get("disconnect") else ""))
+
+    def describe(self) -> str:
+        return "  ".join(
+            f"{d} {c.latency * 1000:.0f}±{c.jitter * 1000:.0f} ms"
+            + (f" {c.bandwidth:.0f} B/s" if c.bandwidth > 0 else "")
+            for d, c in self.conditions.items()
+        )
+
+    def disconnect_all(self) -> None:
+        for client, upstream, _ in self._connections.values():
+            client.transport.abort()
+            upstream.transport.abort()
+
+    async def run_scenario(self, steps: list[dict], loop: bool) -> None:
+        steps = sorted(steps, key=lambda s: float(s.get("at", 0.0)))
+        start = time.monotonic()
+        while True:
+            for step in steps:
+                await asyncio.sleep(max(0.0, start + float(step.get("at", 0.0)) - time.monotonic()))
+                self.apply(step)
+            if not loop or not steps:
+                return
+            # Start over right after the last step
+            start += float(steps[-1].get("at", 0.0))
+
+    # -----------------------------
+    # Proxying
+    # -----------------------------
+    async def handle(self, client: Any) -> None:
+        conn_id = next(self._ids)
+        try:
+            upstream = await connect(
+                self.upstream,
+                subprotocols=[client.subprotocol] if client.subprotocol else None,
+                max_size=None,
+                ping_interval=None,
+            )
+        except (OSError, InvalidHandshake) as e:
+            print(f"[NetSim] connection {conn_id}: upstream refused ({e})")
+            await client.close(CloseCode.TRY_AGAIN_LATER, "upstream unavailable")
+            return
+
+        links = [Link(self, conn_id, "up", upstream), Link(self, conn_id, "down", client)]
+        self._connections[conn_id] = (client, upstream, links)
+        tasks = [
+            asyncio.create_task(self._forward(client, upstream, links[0])),
+            asyncio.create_task(self._forward(upstream, client, links[1])),
+            *(asyncio.create_task(link.pump()) for link in links),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            del self._connections[conn_id]
+            await upstream.close()
+
+    @staticmethod
+    async def _forward(source: Any, target: Any, link: Link) -> None:
+        """Feed source's frames into link; once source closes, close target the same way."""
+        try:
+            async for message in source:
+                link.push(message)
+        except ConnectionClosed:
+            pass
+        # Whatever was still on the wire arrives before the close does
+        await link.queue.join()
+        code = source.close_code
+        if code in ABNORMAL_CLOSES:
+            target.transport.abort()
+        else:
+            await target.close(code, source.close_reason or "")
+
+    def delivered(self, link: Link, received: float, message: str | bytes) -> None:
+        now = time.monotonic()
+        stats = self.stats[link.direction]
+        stats.frames += 1
+        stats.bytes += len(message)
+        stats.delays.append(now - received)
+        if self._record:
+            self._record.writerow([link.conn_id, link.direction, message_type(message), len(message),
+                                   f"{received - self.started:.6f}", f"{now - self.started:.6f}"])
+
+    # -----------------------------
+    # Reporting
+    # -----------------------------
+    async def report(self, interval: float) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(interval)
+            elapsed = time.monotonic() - started
+            queued = {d: 0 for d in DIRECTIONS}
+            for _, _, links in self._connections.values():
+                for link in links:
+                    queued[link.direction] += link.queue.qsize()
+            print(f"--- {len(self._connections)} connections  {self.describe()}")
+            for direction, stats in self.stats.items():
+                print(f"{direction + ':':<6} {stats.frames / elapsed:.0f} frames/s  {stats.bytes / elapsed / 1024:.1f} KiB/s"
+                      f"  queued {queued[direction]}  added {percentiles(stats.delays)}")
+                stats.reset()
+            if self._record_file:
+                self._record_file.flush()
+
+    def close(self) -> None:
+        if self._record_file:
+            self._record_file.close()
+
+
+async def main(args: argparse.Namespace) -> None:
+    sim = NetSim(args.upstream, args.seed, args.record)
+    sim.apply({"latency": args.latency, "jitter": args.jitter, "bandwidth": args.bandwidth})
+    tasks = [asyncio.create_task(sim.report(args.report_interval))]
+    if args.scenario:
+        with open(args.scenario) as f:
+            tasks.append(asyncio.create_task(sim.run_scenario(json.load(f), args.loop)))
+    try:
+        async with serve(sim.handle, args.host, args.port,
+                         subprotocols=[protocol.BINARY_SUBPROTOCOL], max_size=None, ping_interval=None):
+            print(f"[NetSim] Proxying ws://{args.host}:{args.port} -> {args.upstream}")
+            if args.duration > 0:
+                await asyncio.sleep(args.duration)
+            else:
+                await asyncio.Future()
+    finally:
+        for task in tasks:
+            task.cancel()
+        sim.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Network condition simulator between Monster Go clients and server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=LISTEN_PORT)
+    parser.add_argument("--upstream", default=UPSTREAM_URL, help="the real server")
+    parser.add_argument("--latency", type=float, default=0.0, help="one-way delay per direction, ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of the delay, ms")
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="bytes per second per direction, 0 = unlimited")
+    parser.add_argument("--scenario", default=None, help="JSON list of timed steps (see the module docstring)")
+    parser.add_argument("--loop", action="store_true", help="repeat the scenario")
+    parser.add_argument("--seed", type=int, default=None, help="seed the jitter for repeatable runs")
+    parser.add_argument("--record", default=None, help="CSV file with one row per forwarded frame")
+    parser.add_argument("--duration", type=float, default=0.0, help="seconds to run, 0 = until interrupted")
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
@@ -1,104 +1,470 @@
-import threading
+import asyncio
+import json
 import time
-import copy
-from dataclasses import dataclass
-from typing import Dict, Optional
+import math
+from collections.abc import Mapping
+from typing import Dict, Iterator
+
+import numpy as np
+
+from server import protocol
 
 TIMEOUT_TIME = 60.0
 CHECK_INTERVAL_TIME = 10.0
+# Side of one spatial grid cell in world pixels (16 tiles of 64px)
+GRID_CELL_SIZE = 1024.0
+# Rows allocated up front; the arrays double whenever they fill up
+INITIAL_CAPACITY = 1024
+
+# Sort key of a slot: map code, then grid column, then grid row, packed in one int64
+_CELL_BITS = 21
+_CELL_OFFSET = 1 << (_CELL_BITS - 1)
+_CELL_MASK = (1 << _CELL_BITS) - 1
+_MAP_SHIFT = 2 * _CELL_BITS
+# Maps with at most this many players are searched by testing every one of them
+SCAN_LIMIT = 256
+# Distinct map names (and directions) a handler interns, the one-byte id space
+MAX_CODES = 256
+
+
+class _Codes:
+    """Interned strings (map names, directions) stored as small ints in the arrays."""
+    names: list[str]
+    ids: Dict[str, int]
+    what: str
+
+    def __init__(self, names: list[str], what: str):
+        # Start from the protocol's numbering so codes match the binary frames
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.what = what
+
+    def code(self, name: str) -> int:
+        """Code of name, interning it; ValueError once MAX_CODES names are in, so clients can't grow it forever."""
+        code = self.ids.get(name)
+        if code is None:
+            if len(self.names) >= MAX_CODES:
+                raise ValueError(f"too many {self.what} names")
+            code = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return code
+
 
-@dataclass
 class Player:
-    id: int
-    x: float
-    y: float
-    map: str
-    direction: str
-    last_update: float
-
-    def update(self, x: float, y: float, map: str, direction: str = "DOWN") -> None:
-        if x != self.x or y != self.y or map != self.map or direction != self.direction:
-            self.last_update = time.monotonic()
-        self.x = x
-        self.y = y
-        self.map = map
-        self.direction = direction
-
-    def is_inactive(self) -> bool:
-        now = time.monotonic()
-        return (now - self.last_update) >= TIMEOUT_TIME
+    """
+    One row of a PlayerHandler, read on access. Only valid until the player is
+    removed (its slot may then be reused), so don't keep these around.
+    """
+    __slots__ = ("id", "_handler", "_slot")
+
+    def __init__(self, handler: "PlayerHandler", pid: int, slot: int):
+        self.id = pid
+        self._handler = handler
+        self._slot = slot
+
+    @property
+    def x(self) -> float:
+        return float(self._handler._x[self._slot])
+
+    @property
+    def y(self) -> float:
+        return float(self._handler._y[self._slot])
+
+    @property
+    def map(self) -> str:
+        return self._handler._maps.names[self._handler._map[self._slot]]
+
+    @property
+    def direction(self) -> str:
+        return self._handler._directions.names[self._handler._dir[self._slot]]
+
+    @property
+    def last_update(self) -> float:
+        return float(self._handler._last[self._slot])
+
+    def fragment(self) -> str:
+        """`"id": {...}` entry of a JSON players object."""
+        h = self._handler
+        fragment = h._fragments[self._slot]
+        if fragment is None:
+            fragment = h._fragments[self._slot] = f'"{self.id}": ' + json.dumps(h._row(self._slot))
+        return fragment
+
+    def record(self) -> bytes:
+        """Binary record of a players frame; empty if the map has no protocol id."""
+        h = self._handler
+        record = h._records[self._slot]
+        if record is None:
+            row = h._row(self._slot)
+            record = h._records[self._slot] = protocol.encode_player_record(
+                self.id, row["x"], row["y"], row["map"], row["direction"]
+            ) or b""
+        return record
+
+
+class _PlayerView(Mapping):
+    """handler.players: a read-only id -> Player mapping over the arrays."""
+    __slots__ = ("_handler",)
+
+    def __init__(self, handler: "PlayerHandler"):
+        self._handler = handler
+
+    def __getitem__(self, pid: int) -> Player:
+        return Player(self._handler, pid, self._handler._slots[pid])
+
+    def __contains__(self, pid: object) -> bool:
+        return pid in self._handler._slots
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._handler._slots)
+
+    def __len__(self) -> int:
+        return len(self._handler._slots)
 
 
 class PlayerHandler:
-    _lock: threading.Lock
-    _stop_event: threading.Event
-    _thread: threading.Thread | None
-    
-    players: Dict[int, Player]
+    """
+    Player registry for the server. It lives entirely on the asyncio event loop,
+    so nothing here takes a lock; call it only from coroutines on that loop.
+
+    Players are rows of NumPy arrays (x, y, map code, direction code, last
+    update) with an id -> row index and a free list, so an idle player costs a
+    few dozen bytes and no Python objects. The idle sweep is one comparison
+    over the whole table. For area queries the rows are sorted by (map, grid
+    cell) at most once per tick, after something moved; a radius query is then
+    a few binary searches plus one vectorized distance test.
+    """
+    _timeout: float
+    _interval: float
+    _task: asyncio.Task | None
+
+    players: _PlayerView
     _next_id: int
+    _id_step: int
+    # Players added/changed or removed since the last drain_changes()
+    _dirty: set[int]
+    _removed: set[int]
+    _cell_size: float
+    # Latest not-yet-applied update per player: (x, y, map, direction)
+    _mailbox: Dict[int, tuple[float, float, str, str]]
 
-    def __init__(self, *, timeout_seconds: float = 120.0, check_interval_seconds: float = 5.0):
-        self._lock = threading.Lock()
-        self._stop_event = threading.Event()
-        self._thread = None
-        
-        self.players = {}
-        self._next_id = 0
-        
-    # Threading
+    # One row per slot; _ids is -1 for free slots
+    _ids: np.ndarray
+    _x: np.ndarray
+    _y: np.ndarray
+    _map: np.ndarray
+    _dir: np.ndarray
+    _last: np.ndarray
+    _slots: Dict[int, int]
+    _free: list[int]
+    _maps: _Codes
+    _directions: _Codes
+    # Encoded pieces of players frames per slot, dropped whenever the row changes
+    _fragments: list[str | None]
+    _records: list[bytes | None]
+    # Slots on a map sorted by (map, cell), their keys and each map's run of them;
+    # None until the next query after a move
+    _order: np.ndarray | None
+    _keys: np.ndarray | None
+    _spans: Dict[int, tuple[int, int]]
+
+    def __init__(self, *, timeout_seconds: float = TIMEOUT_TIME, check_interval_seconds: float = CHECK_INTERVAL_TIME,
+                 cell_size: float = GRID_CELL_SIZE, id_start: int = 0, id_step: int = 1):
+        self._timeout = timeout_seconds
+        self._interval = check_interval_seconds
+        self._task = None
+
+        self.players = _PlayerView(self)
+        # Several handlers can share an id space by using interleaved sequences
+        self._next_id = id_start
+        self._id_step = id_step
+        self._dirty = set()
+        self._removed = set()
+        self._cell_size = cell_size
+        self._mailbox = {}
+
+        self._ids = np.full(INITIAL_CAPACITY, -1, dtype=np.int64)
+        self._x = np.zeros(INITIAL_CAPACITY)
+        self._y = np.zeros(INITIAL_CAPACITY)
+        self._map = np.zeros(INITIAL_CAPACITY, dtype=np.int32)
+        self._dir = np.zeros(INITIAL_CAPACITY, dtype=np.int16)
+        self._last = np.zeros(INITIAL_CAPACITY)
+        self._slots = {}
+        # Popped from the end, so low slots are reused first
+        self._free = list(range(INITIAL_CAPACITY - 1, -1, -1))
+        self._maps = _Codes(protocol.MAP_NAMES, "map")
+        self._directions = _Codes(protocol.DIRECTIONS, "direction")
+        self._fragments = [None] * INITIAL_CAPACITY
+        self._records = [None] * INITIAL_CAPACITY
+        self._order = None
+        self._keys = None
+        self._spans = {}
+
+    # Expiry
     def start(self) -> None:
-        if self._thread and self._thread.is_alive():
+        """Start expiring idle players; must be called from the running event loop."""
+        if self._task and not self._task.done():
             return
-        self._stop_event.clear()
-        self._thread = threading.Thread(target=self._cleaner, name="PlayerCleaner", daemon=True)
-        self._thread.start()
+        self._task = asyncio.get_running_loop().create_task(self._expire_loop())
 
     def stop(self) -> None:
-        self._stop_event.set()
-        if self._thread:
-            self._thread.join(timeout=2.0)
-
-    def _cleaner(self) -> None:
-        while not self._stop_event.wait(CHECK_INTERVAL_TIME):
-            now = time.monotonic()
-            to_remove: list[int] = []
-            with self._lock:
-                for pid, p in list(self.players.items()):
-                    if now - p.last_update >= TIMEOUT_TIME:
-                        to_remove.append(pid)
-                for pid in to_remove:
-                    _ = self.players.pop(pid, None)
-                    
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _expire_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            self.expire(time.monotonic())
+
+    def expire(self, now: float) -> list[int]:
+        """
+        Remove our own players idle for the timeout as of `now`. Players from other
+        id sequences are mirrored from other workers or nodes, which only publish
+        changes: their owner expires them and publishes the removal.
+        """
+        own = self._ids % self._id_step == self._next_id % self._id_step
+        idle = np.flatnonzero((self._ids >= 0) & own & (self._last <= now - self._timeout))
+        expired = self._ids[idle].tolist()
+        for pid in expired:
+            self._remove(pid)
+        return expired
+
+    # Storage
+    def _grow(self) -> None:
+        old = len(self._ids)
+        new = old * 2
+        self._ids = np.concatenate([self._ids, np.full(old, -1, dtype=np.int64)])
+        for name in ("_x", "_y", "_map", "_dir", "_last"):
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate([column, np.zeros(old, dtype=column.dtype)]))
+        self._fragments.extend([None] * old)
+        self._records.extend([None] * old)
+        self._free.extend(range(new - 1, old - 1, -1))
+
+    def _add(self, pid: int, x: float, y: float, map_name: str, direction: str) -> None:
+        # Before taking a slot, as these may raise
+        map_code = self._maps.code(map_name)
+        dir_code = self._directions.code(direction)
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self._slots[pid] = slot
+        self._ids[slot] = pid
+        self._x[slot] = x
+        self._y[slot] = y
+        self._map[slot] = map_code
+        self._dir[slot] = dir_code
+        self._last[slot] = time.monotonic()
+        self._dirty.add(pid)
+        self._order = None
+
+    def _row(self, slot: int) -> dict:
+        return {
+            "id": int(self._ids[slot]),
+            "x": float(self._x[slot]),
+            "y": float(self._y[slot]),
+            "map": self._maps.names[self._map[slot]],
+            "direction": self._directions.names[self._dir[slot]]
+        }
+
     # API
     def register(self) -> int:
-        with self._lock:
-            pid = self._next_id
-            self._next_id += 1
-            self.players[pid] = Player(pid, 0.0, 0.0, "", "DOWN", time.monotonic())
-            return pid
-    
+        pid = self._next_id
+        self._next_id += self._id_step
+        self._add(pid, 0.0, 0.0, "", "DOWN")
+        return pid
+
+    def adopt(self, pid: int, x: float, y: float, map_name: str, direction: str = "DOWN") -> None:
+        """Take over a player whose id was assigned elsewhere (e.g. handed off from another shard)."""
+        self._remove(pid)
+        self._removed.discard(pid)
+        self._add(pid, float(x), float(y), str(map_name), str(direction))
+
     def unregister(self, pid: int) -> None:
-        with self._lock:
-            self.players.pop(pid, None)
+        self._remove(pid)
+
+    def _remove(self, pid: int) -> None:
+        self._mailbox.pop(pid, None)
+        slot = self._slots.pop(pid, None)
+        if slot is None:
+            return
+        self._ids[slot] = -1
+        self._map[slot] = 0
+        self._fragments[slot] = None
+        self._records[slot] = None
+        self._free.append(slot)
+        self._order = None
+        self._dirty.discard(pid)
+        self._removed.add(pid)
 
     def update(self, pid: int, x: float, y: float, map_name: str, direction: str = "DOWN") -> bool:
-        with self._lock:
-            p = self.players.get(pid)
-            if not p:
-                return False
-            else:
-                p.update(float(x), float(y), str(map_name), str(direction))
-                return True
-
-    def list_players(self) -> dict:
-        with self._lock:
-            player_list = {}
-            for p in self.players.values():
-                player_list[p.id] = {
-                    "id": p.id,
-                    "x": p.x,
-                    "y": p.y,
-                    "map": p.map,
-                    "direction": p.direction
-                }
-            return player_list
+        slot = self._slots.get(pid)
+        if slot is None:
+            return False
+        x = float(x)
+        y = float(y)
+        map_code = self._maps.code(str(map_name))
+        dir_code = self._directions.code(str(direction))
+        # Any update counts as a sign of life, so a client standing still
+        # (sending only heartbeats) isn't expired
+        self._last[slot] = time.monotonic()
+        moved = x != self._x[slot] or y != self._y[slot] or map_code != self._map[slot]
+        if moved or dir_code != self._dir[slot]:
+            self._x[slot] = x
+            self._y[slot] = y
+            self._map[slot] = map_code
+            self._dir[slot] = dir_code
+            self._fragments[slot] = None
+            self._records[slot] = None
+            self._dirty.add(pid)
+            if moved:
+                self._order = None
+        return True
+
+    def submit(self, pid: int, x: float, y: float, map_name: str, direction: str = "DOWN") -> None:
+        """
+        Stash an update to be applied by apply_pending(); later ones overwrite earlier.
+        Raises ValueError for a position or name update() couldn't store, so the tick never sees one.
+        """
+        x = float(x)
+        y = float(y)
+        protocol.check_position(x, y)
+        map_name = str(map_name)
+        direction = str(direction)
+        # Interned now, so apply_pending() can't run out of codes
+        self._maps.code(map_name)
+        self._directions.code(direction)
+        self._mailbox[pid] = (x, y, map_name, direction)
+
+    def apply_pending(self) -> int:
+        """Apply every stashed update in one batch, returns how many were applied."""
+        if not self._mailbox:
+            return 0
+        pending = self._mailbox
+        self._mailbox = {}
+        for pid, (x, y, map_name, direction) in pending.items():
+            self.update(pid, x, y, map_name, direction)
+        return len(pending)
+
+    def states(self) -> Iterator[tuple[int, float, float, str, str]]:
+        """(id, x, y, map, direction) of every player, read off the arrays in bulk."""
+        live = np.flatnonzero(self._ids >= 0)
+        maps = self._maps.names
+        directions = self._directions.names
+        for pid, x, y, m, d in zip(self._ids[live].tolist(), self._x[live].tolist(), self._y[live].tolist(),
+                                   self._map[live].tolist(), self._dir[live].tolist()):
+            yield pid, x, y, maps[m], directions[d]
+
+    # Area queries
+    def _index(self) -> tuple[np.ndarray, np.ndarray, Dict[int, tuple[int, int]]]:
+        """
+        Slots of every player on a map sorted by (map, cell), their sort keys,
+        and the [start, end) run of each map code in them.
+        """
+        if self._order is None:
+            live = np.flatnonzero((self._ids >= 0) & (self._map > 0))
+            gx = np.clip(np.floor(self._x[live] / self._cell_size).astype(np.int64) + _CELL_OFFSET, 0, _CELL_MASK)
+            gy = np.clip(np.floor(self._y[live] / self._cell_size).astype(np.int64) + _CELL_OFFSET, 0, _CELL_MASK)
+            keys = (self._map[live].astype(np.int64) << _MAP_SHIFT) | (gx << _CELL_BITS) | gy
+            order = np.argsort(keys, kind="stable")
+            self._order = live[order]
+            self._keys = keys[order]
+            codes, starts = np.unique(self._keys >> _MAP_SHIFT, return_index=True)
+            bounds = starts.tolist() + [len(keys)]
+            self._spans = {code: (bounds[i], bounds[i + 1]) for i, code in enumerate(codes.tolist())}
+        return self._order, self._keys, self._spans
+
+    def visible_ids(self, pid: int, radius: float) -> set[int]:
+        """Ids of the other players on pid's map within `radius` pixels of it."""
+        slot = self._slots.get(pid)
+        if slot is None:
+            return set()
+        map_code = int(self._map[slot])
+        if not map_code:
+            return set()
+        order, keys, spans = self._index()
+        start, end = spans[map_code]
+        mx = self._x[slot]
+        my = self._y[slot]
+        if not (math.isfinite(mx) and math.isfinite(my)):
+            # Nothing is within any distance of it, and it has no grid cell
+            return set()
+        if end - start <= SCAN_LIMIT:
+            # Few enough to test them all at once
+            near = order[start:end]
+        else:
+            # Each grid column within reach is one contiguous run of the sorted keys
+            reach = math.ceil(radius / self._cell_size)
+            cx = math.floor(mx / self._cell_size)
+            cy = math.floor(my / self._cell_size)
+            columns = (np.arange(cx - reach, cx + reach + 1) + _CELL_OFFSET) << _CELL_BITS
+            columns |= map_code << _MAP_SHIFT
+            bounds = np.searchsorted(keys, np.concatenate([
+                columns | (cy - reach + _CELL_OFFSET), columns | (cy + reach + _CELL_OFFSET + 1)
+            ])).tolist()
+            n = len(columns)
+            runs = [order[s:e] for s, e in zip(bounds[:n], bounds[n:]) if e > s]
+            near = np.concatenate(runs)
+        dx = self._x[near] - mx
+        dy = self._y[near] - my
+        hit = near[(dx * dx + dy * dy <= radius * radius) & (near != slot)]
+        return set(self._ids[hit].tolist())
+
+    def split_by_distance(self, pid: int, ids: list[int], radius: float) -> tuple[list[int], list[int]]:
+        """(those of `ids` within radius of pid, the rest); all of them are near if pid is gone."""
+        slot = self._slots.get(pid)
+        if slot is None or not ids:
+            return list(ids), []
+        others = np.fromiter((self._slots[oid] for oid in ids), dtype=np.int64, count=len(ids))
+        dx = self._x[others] - self._x[slot]
+        dy = self._y[others] - self._y[slot]
+        mask = (dx * dx + dy * dy <= radius * radius).tolist()
+        return ([oid for oid, ok in zip(ids, mask) if ok],
+                [oid for oid, ok in zip(ids, mask) if not ok])
+
+    def players_on_map(self, map_name: str) -> set[int]:
+        """Ids of every player currently on map_name."""
+        map_code = self._maps.ids.get(map_name)
+        if not map_code:
+            return set()
+        order, _, spans = self._index()
+        start, end = spans.get(map_code, (0, 0))
+        return set(self._ids[order[start:end]].tolist())
+
+    def map_counts(self) -> Dict[str, int]:
+        """Number of players per map name ("" for players not on a map yet)."""
+        counts = np.bincount(self._map[self._ids >= 0], minlength=len(self._maps.names))
+        return {self._maps.names[code]: n for code, n in enumerate(counts.tolist()) if n}
+
+    def dump(self) -> dict:
+        """Players and the id counter as plain data, for a snapshot."""
+        return {
+            "next_id": self._next_id,
+            "players": [list(state) for state in self.states()],
+        }
+
+    def restore(self, state: dict) -> list[int]:
+        """Re-add the players of a dump(); each gets a fresh idle timeout. Returns their ids."""
+        self._next_id = max(self._next_id, int(state["next_id"]))
+        ids = []
+        for pid, x, y, map_name, direction in state["players"]:
+            self.adopt(pid, x, y, map_name, direction)
+            ids.append(pid)
+        return ids
+
+    def drain_changes(self) -> tuple[dict, list[int]]:
+        """
+        Return (changed, removed) since the previous call and reset the tracking.
+        `changed` maps the id of each player that was registered or moved to its
+        {"id", "x", "y", "map", "direction"} row; `removed` lists ids that left in the meantime.
+        """
+        changed = {}
+        for pid in self._dirty:
+            slot = self._slots.get(pid)
+            if slot is not None:
+                changed[pid] = self._row(slot)
+        removed = list(self._removed)
+        self._dirty.clear()
+        self._removed.clear()
+        return changed, removed
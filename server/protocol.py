@@ -0,0 +1,129 @@
+"""
+Compact binary encoding for position traffic.
+
+Clients that offer the BINARY_SUBPROTOCOL WebSocket subprotocol exchange
+player_update / players_update / players_delta as binary frames built from
+the fixed-layout records below. Everything else (registration, chat, errors)
+stays JSON in text frames, and clients that don't offer the subprotocol keep
+speaking plain JSON.
+
+All values are little-endian. Coordinates are quantized to 1/COORD_SCALE px.
+"""
+import math
+import struct
+
+BINARY_SUBPROTOCOL = "i2p-bin.v1"
+
+# Map names interned to one byte; 0 means "not on a map yet".
+# Only maps listed here can be sent in binary, others fall back to JSON.
+MAP_NAMES = ["", "map.tmx", "gym.tmx", "shop.tmx", "delta.tmx"]
+MAP_IDS = {name: i for i, name in enumerate(MAP_NAMES)}
+
+# Same order as src.utils.Direction
+DIRECTIONS = ["UP", "DOWN", "LEFT", "RIGHT", "NONE"]
+DIRECTION_IDS = {name: i for i, name in enumerate(DIRECTIONS)}
+
+COORD_SCALE = 8
+# Largest |x| or |y| the server accepts, in px; quantized, it still fits the int32 fields
+MAX_COORD = float(1 << 24)
+
+# Frame kinds (first byte of every binary frame)
+KIND_PLAYER_UPDATE = 1
+KIND_PLAYERS_UPDATE = 2
+KIND_PLAYERS_DELTA = 3
+
+# kind, map id, direction, x, y
+PLAYER_UPDATE = struct.Struct("<BBBii")
+# kind, seq, base, timestamp, n_players, n_removed
+PLAYERS_HEADER = struct.Struct("<BIidHH")
+# id, map id, direction, x, y
+PLAYER_RECORD = struct.Struct("<IBBii")
+PLAYER_ID = struct.Struct("<I")
+
+
+def _quantize(v: float) -> int:
+    return int(round(v * COORD_SCALE))
+
+
+def check_position(x: float, y: float) -> None:
+    """Raise ValueError unless x and y are finite and within MAX_COORD."""
+    if not (math.isfinite(x) and math.isfinite(y) and abs(x) <= MAX_COORD and abs(y) <= MAX_COORD):
+        raise ValueError("position out of range")
+
+
+def encode_player_update(x: float, y: float, map_name: str, direction: str) -> bytes | None:
+    """Client -> server position. None if map_name has no id (send JSON instead)."""
+    map_id = MAP_IDS.get(map_name)
+    if map_id is None:
+        return None
+    try:
+        return PLAYER_UPDATE.pack(
+            KIND_PLAYER_UPDATE, map_id, DIRECTION_IDS.get(direction, 1), _quantize(x), _quantize(y)
+        )
+    except (struct.error, ValueError, OverflowError):
+        return None
+
+
+def decode_player_update(frame: bytes) -> tuple[float, float, str, str]:
+    """Raises ValueError (struct.error is one) for malformed or out-of-range updates."""
+    _, map_id, direction, x, y = PLAYER_UPDATE.unpack(frame)
+    if map_id >= len(MAP_NAMES) or direction >= len(DIRECTIONS):
+        raise ValueError("unknown map or direction id")
+    x /= COORD_SCALE
+    y /= COORD_SCALE
+    check_position(x, y)
+    return x, y, MAP_NAMES[map_id], DIRECTIONS[direction]
+
+
+def encode_player_record(pid: int, x: float, y: float, map_name: str, direction: str) -> bytes | None:
+    """
+    One player's record of a players frame, for assemble_players(). None if
+    map_name has no id or the player doesn't fit the record (send JSON instead).
+    """
+    map_id = MAP_IDS.get(map_name)
+    if map_id is None:
+        return None
+    try:
+        return PLAYER_RECORD.pack(pid, map_id, DIRECTION_IDS.get(direction, 1), _quantize(x), _quantize(y))
+    except (struct.error, ValueError, OverflowError):
+        return None
+
+
+def assemble_players(kind: int, seq: int, base: int, timestamp: float,
+                     records: list[bytes], removed: list[int]) -> bytes:
+    """A players_update or players_delta frame (kind) from records built by encode_player_record()."""
+    header = PLAYERS_HEADER.pack(kind, seq, base, timestamp, len(records), len(removed))
+    return header + b"".join(records) + b"".join(PLAYER_ID.pack(pid) for pid in removed)
+
+
+def decode_frame(frame: bytes) -> dict:
+    """Decode any binary frame back into the dict its JSON counterpart would parse to."""
+    kind = frame[0]
+    if kind == KIND_PLAYER_UPDATE:
+        x, y, map_name, direction = decode_player_update(frame)
+        return {"type": "player_update", "x": x, "y": y, "map": map_name, "direction": direction}
+    if kind not in (KIND_PLAYERS_UPDATE, KIND_PLAYERS_DELTA):
+        raise ValueError(f"unknown binary frame kind {kind}")
+
+    _, seq, base, timestamp, n_players, n_removed = PLAYERS_HEADER.unpack_from(frame, 0)
+    players = {}
+    offset = PLAYERS_HEADER.size
+    for pid, map_id, direction, x, y in PLAYER_RECORD.iter_unpack(
+        frame[offset:offset + PLAYER_RECORD.size * n_players]
+    ):
+        players[pid] = {
+            "id": pid,
+            "x": x / COORD_SCALE,
+            "y": y / COORD_SCALE,
+            "map": MAP_NAMES[map_id],
+            "direction": DIRECTIONS[direction],
+        }
+    offset += PLAYER_RECORD.size * n_players
+    removed = [pid for (pid,) in PLAYER_ID.iter_unpack(frame[offset:offset + PLAYER_ID.size * n_removed])]
+
+    if kind == KIND_PLAYERS_DELTA:
+        return {
+            "type": "players_delta", "seq": seq, "base": base,
+            "changed": players, "removed": removed, "timestamp": timestamp,
+        }
+    return {"type": "players_update", "players": players, "seq": seq, "timestamp": timestamp}
@@ -0,0 +1,79 @@
+"""
+Session resume tokens.
+
+Every player gets a random token at registration. When its client disconnects
+the player is kept for a grace window instead of being removed at once, and a
+client presenting the token in its hello within that window takes the player
+back: same id, same position, and only the chat it missed. A reconnect storm
+after a network blip then costs a token lookup per client instead of a new
+registration and a full chat backfill each.
+"""
+import asyncio
+import secrets
+from typing import Callable
+
+# Seconds a disconnected player is kept for its client to come back
+RESUME_GRACE = 30.0
+
+
+class ResumeTokens:
+    grace: float
+    # Called with the player id when a detached player's grace window runs out
+    on_expire: Callable[[int], None]
+    _tokens: dict[str, int]
+    _by_player: dict[int, str]
+    _detached: dict[int, asyncio.TimerHandle]
+
+    def __init__(self, on_expire: Callable[[int], None], grace: float = RESUME_GRACE):
+        self.grace = grace
+        self.on_expire = on_expire
+        self._tokens = {}
+        self._by_player = {}
+        self._detached = {}
+
+    def issue(self, pid: int) -> str:
+        token = secrets.token_urlsafe(16)
+        self._tokens[token] = pid
+        self._by_player[pid] = token
+        return token
+
+    def claim(self, token: str) -> int | None:
+        """Player id for `token` (connected or detached), or None if it isn't valid any more."""
+        pid = self._tokens.get(token)
+        if pid is None:
+            return None
+        handle = self._detached.pop(pid, None)
+        if handle:
+            handle.cancel()
+        return pid
+
+    def detach(self, pid: int) -> None:
+        """The player's client went away: drop the player after the grace window unless claimed."""
+        if pid in self._detached:
+            return
+        self._detached[pid] = asyncio.get_running_loop().call_later(self.grace, self._expire, pid)
+
+    def forget(self, pid: int) -> None:
+        token = self._by_player.pop(pid, None)
+        if token is not None:
+            self._tokens.pop(token, None)
+        handle = self._detached.pop(pid, None)
+        if handle:
+            handle.cancel()
+
+    def _expire(self, pid: int) -> None:
+        self._detached.pop(pid, None)
+        self.forget(pid)
+        self.on_expire(pid)
+
+    def dump(self) -> dict[int, str]:
+        return dict(self._by_player)
+
+    def restore(self, tokens: dict, pids: list[int]) -> None:
+        """After a restart: the players in `pids` start detached, claimable with their saved tokens."""
+        for pid in pids:
+            token = tokens.get(str(pid))
+            if token:
+                self._tokens[token] = pid
+                self._by_player[pid] = token
+            self.detach(pid)
@@ -0,0 +1,307 @@
+"""
+Map-sharded server mode.
+
+The router process (server.py --shards) owns the WebSocket connections, player
+ids and chat. Every map in `maps` is simulated and broadcast by its own worker
+process running a normal PlayerHandler + tick loop. Client frames are forwarded
+to the worker that owns the client's current map, and the frames the worker
+builds are passed back untouched for the router to send.
+
+When a worker sees a player_update for a map it doesn't own (a teleport), it
+drops the player and hands it off; the router re-routes the client and the new
+worker adopts the player with its last state, starting it from a keyframe.
+
+Router and workers talk over a localhost TCP socket with length-prefixed ops.
+"""
+import asyncio
+import json
+import multiprocessing
+import struct
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from server.playerHandler import PlayerHandler
+from server.clientSession import ClientSession, Frame
+from server.tickScheduler import TickScheduler
+from server.adaptiveRate import LoadGovernor
+from server.broadcast import players_frame, frame_failed, apply_player_message
+from server import protocol
+
+# router -> worker
+OP_OPEN = 1
+OP_MSG = 2
+OP_CLOSE = 3
+OP_ADOPT = 4
+OP_RESYNC = 5
+# worker -> router
+OP_READY = 10
+OP_POSITION = 11
+OP_SEND = 12
+OP_HANDOFF = 13
+OP_CHAT = 14
+
+# op, player id, payload is bytes, payload length
+HEADER = struct.Struct("<BIBI")
+
+
+def write_op(writer: asyncio.StreamWriter, op: int, pid: int, payload: Frame = b"") -> None:
+    if isinstance(payload, str):
+        data = payload.encode("utf-8")
+        is_bytes = 0
+    else:
+        data = payload
+        is_bytes = 1
+    writer.write(HEADER.pack(op, pid, is_bytes, len(data)) + data)
+
+
+async def read_op(reader: asyncio.StreamReader) -> tuple[int, int, Frame]:
+    op, pid, is_bytes, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    data = await reader.readexactly(length) if length else b""
+    return op, pid, data if is_bytes else data.decode("utf-8")
+
+
+def shard_for(maps: list[str], map_name: str) -> int:
+    """Index of the worker owning map_name; unplaced players and unknown maps go to the first."""
+    try:
+        return maps.index(map_name)
+    except ValueError:
+        return 0
+
+
+@dataclass
+class ShardConfig:
+    maps: list[str]
+    tick_rate: float
+    view_radius: float
+    keyframe_interval: float
+
+
+# ------------------------------
+# Worker process
+# ------------------------------
+@dataclass(eq=False)
+class _RelayedSession(ClientSession):
+    """A client as seen by a worker: frames go back to the router instead of a socket."""
+    link: Any = None
+
+    def send(self, frame: Frame) -> None:
+        write_op(self.link, OP_SEND, self.player_id, frame)
+
+    def send_position(self, frame: Frame) -> bool:
+        write_op(self.link, OP_POSITION, self.player_id, frame)
+        return False
+
+
+def run_shard(index: int, router_port: int, config: ShardConfig) -> None:
+    """multiprocessing target for one map worker."""
+    try:
+        asyncio.run(_shard_main(index, router_port, config))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _shard_main(index: int, router_port: int, config: ShardConfig) -> None:
+    reader, link = await asyncio.open_connection("127.0.0.1", router_port)
+    write_op(link, OP_READY, index)
+    handler = PlayerHandler()
+    handler.start()
+    sessions: dict[int, _RelayedSession] = {}
+    tick_task = asyncio.create_task(_shard_ticks(handler, sessions, link, config))
+
+    def add_session(pid: int, state: dict) -> _RelayedSession:
+        session = _RelayedSession(None, pid, link=link)
+        session.binary = bool(state.get("binary", False))
+        session.delta = bool(state.get("delta", False))
+        sessions[pid] = session
+        return session
+
+    try:
+        while True:
+            op, pid, payload = await read_op(reader)
+            if op == OP_OPEN:
+                add_session(pid, json.loads(payload))
+                handler.adopt(pid, 0.0, 0.0, "", "DOWN")
+            elif op == OP_ADOPT:
+                state = json.loads(payload)
+                add_session(pid, state)
+                try:
+                    handler.adopt(pid, state["x"], state["y"], state["map"], state["direction"])
+                except ValueError:
+                    # Out of map name codes here: park the player until its next update
+                    handler.adopt(pid, 0.0, 0.0, "", "DOWN")
+            elif op == OP_CLOSE:
+                sessions.pop(pid, None)
+                handler.unregister(pid)
+            elif op == OP_RESYNC:
+                session = sessions.get(pid)
+                if session:
+                    session.baseline_seq = -1
+            elif op == OP_MSG:
+                session = sessions.get(pid)
+                if session is None:
+                    continue  # already handed off, the router will catch up
+                _shard_message(index, handler, sessions, session, payload, config)
+            await link.drain()
+    except asyncio.IncompleteReadError:
+        pass  # router went away
+    finally:
+        tick_task.cancel()
+        handler.stop()
+
+
+def _shard_message(index: int, handler: PlayerHandler, sessions: dict[int, _RelayedSession],
+                   session: _RelayedSession, message: Frame, config: ShardConfig) -> None:
+    try:
+        data = protocol.decode_frame(message) if isinstance(message, bytes) else json.loads(message)
+        if data.get("type") == "player_update":
+            map_name = str(data.get("map", ""))
+            if map_name and shard_for(config.maps, map_name) != index:
+                protocol.check_position(float(data.get("x", 0)), float(data.get("y", 0)))
+                # Teleported off our map: hand the player to the owning worker
+                sessions.pop(session.player_id, None)
+                handler.unregister(session.player_id)
+                write_op(session.link, OP_HANDOFF, session.player_id, json.dumps({
+                    "x": float(data.get("x", 0)),
+                    "y": float(data.get("y", 0)),
+                    "map": map_name,
+                    "direction": str(data.get("direction", "DOWN")),
+                    "binary": session.binary,
+                    "delta": session.delta,
+                }))
+                return
+        if apply_player_message(handler, session, data):
+            return
+        if data.get("type") == "chat_send":
+            write_op(session.link, OP_CHAT, session.player_id, json.dumps({
+                "text": str(data.get("text", "")),
+                "channel": str(data.get("channel", "global")),
+            }))
+    except json.JSONDecodeError:
+        session.send(json.dumps({"type": "error", "message": "invalid_json"}))
+    except Exception as e:
+        session.send(json.dumps({"type": "error", "message": str(e)}))
+
+
+async def _shard_ticks(handler: PlayerHandler, sessions: dict[int, _RelayedSession],
+                       link: asyncio.StreamWriter, config: ShardConfig) -> None:
+    scheduler = TickScheduler(config.tick_rate)
+    governor = LoadGovernor(scheduler, config.tick_rate)
+    last_keyframe = time.monotonic()
+    while True:
+        now = await scheduler.next_tick()
+        started = time.perf_counter()
+        handler.apply_pending()
+        changed, _ = handler.drain_changes()
+        keyframe_due = now - last_keyframe >= config.keyframe_interval
+        if keyframe_due:
+            last_keyframe = now
+        for session in sessions.values():
+            # One client's frame failing must not stop the tick for everyone else
+            try:
+                frame = players_frame(handler, session, changed, keyframe_due, config.view_radius)
+            except Exception:
+                frame_failed(session)
+                continue
+            if frame is not None:
+                session.send_position(frame)
+        governor.observe(time.perf_counter() - started)
+        await link.drain()
+
+
+# ------------------------------
+# Router
+# ------------------------------
+class ShardRouter:
+    """Router side: spawns the workers and moves frames between them and the clients."""
+    config: ShardConfig
+    sessions: dict[int, ClientSession]
+    _on_chat: Callable[[ClientSession, str, str], None]
+    _links: list[asyncio.StreamWriter | None]
+    _route: dict[int, int]
+    _processes: list[multiprocessing.Process]
+    _ready: asyncio.Event
+
+    def __init__(self, config: ShardConfig, on_chat: Callable[[ClientSession, str, str], None]):
+        self.config = config
+        self.sessions = {}
+        self._on_chat = on_chat
+        self._links = [None] * len(config.maps)
+        self._route = {}
+        self._processes = []
+        self._ready = asyncio.Event()
+
+    async def start(self) -> None:
+        server = await asyncio.start_server(self._serve_link, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        for index, map_name in enumerate(self.config.maps):
+            process = multiprocessing.Process(
+                target=run_shard, args=(index, port, self.config),
+                name=f"Shard-{map_name}", daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+        await self._ready.wait()
+
+    def stop(self) -> None:
+        for process in self._processes:
+            process.terminate()
+
+    def open(self, session: ClientSession) -> None:
+        self.sessions[session.player_id] = session
+        self._route[session.player_id] = 0
+        self._write(0, OP_OPEN, session.player_id, json.dumps({"binary": session.binary}))
+
+    def forward(self, session: ClientSession, message: Frame) -> None:
+        self._write(self._route[session.player_id], OP_MSG, session.player_id, message)
+
+    def close(self, session: ClientSession) -> None:
+        self.sessions.pop(session.player_id, None)
+        shard = self._route.pop(session.player_id, None)
+        if shard is not None:
+            self._write(shard, OP_CLOSE, session.player_id)
+
+    def map_of(self, pid: int) -> str:
+        """Map of the worker currently simulating pid."""
+        shard = self._route.get(pid)
+        return self.config.maps[shard] if shard is not None else ""
+
+    def players_on_map(self, map_name: str) -> set[int]:
+        shard = shard_for(self.config.maps, map_name)
+        return {pid for pid, s in self._route.items() if s == shard}
+
+    def _write(self, shard: int, op: int, pid: int, payload: Frame = b"") -> None:
+        link = self._links[shard]
+        if link is not None:
+            write_op(link, op, pid, payload)
+
+    async def _serve_link(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        op, index, _ = await read_op(reader)
+        if op != OP_READY:
+            writer.close()
+            return
+        self._links[index] = writer
+        if all(link is not None for link in self._links):
+            self._ready.set()
+        try:
+            while True:
+                op, pid, payload = await read_op(reader)
+                session = self.sessions.get(pid)
+                if session is None:
+                    continue
+                if op == OP_POSITION:
+                    if session.send_position(payload):
+                        # Dropped a frame the client's delta chain depended on
+                        self._write(index, OP_RESYNC, pid)
+                elif op == OP_SEND:
+                    session.send(payload)
+                elif op == OP_HANDOFF:
+                    target = shard_for(self.config.maps, json.loads(payload)["map"])
+                    self._route[pid] = target
+                    self._write(target, OP_ADOPT, pid, payload)
+                elif op == OP_CHAT:
+                    chat = json.loads(payload)
+                    self._on_chat(session, chat["text"], chat["channel"])
+        except asyncio.IncompleteReadError:
+            print(f"[Server] Shard {self.config.maps[index]} disconnected")
+            self._links[index] = None
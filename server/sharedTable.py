@@ -0,0 +1,198 @@
+"""
+Player table shared between SO_REUSEPORT worker processes (server.py --workers N).
+
+The table is one multiprocessing.shared_memory block of fixed-width records.
+Every worker owns a disjoint range of slots and is the only writer of them, so a
+per-slot seqlock is enough: the writer bumps the slot's sequence to odd, writes
+the fields, then bumps it back to even; readers retry while it is odd or if it
+moved under them. Readers detect changed slots by comparing sequence numbers.
+
+A worker rewrites each of its slots at least every REFRESH_INTERVAL, even when
+nothing changed, so last_update shows it is alive. Slots whose last_update is
+older than STALE_AFTER belong to a worker that died; their players are dropped.
+"""
+import time
+from multiprocessing import shared_memory
+import struct
+
+from server.playerHandler import PlayerHandler
+from server import protocol
+
+# seq, pad, id, x, y, last_update, map id, direction
+RECORD = struct.Struct("<IIqdddBB6x")
+SEQ = struct.Struct("<I")
+FREE_ID = -1
+# Tries read() gives a slot before leaving it for the next tick; a write takes far fewer
+READ_ATTEMPTS = 100
+# Seconds between rewrites of an unchanged slot, and the age at which a mirrored one is dropped
+REFRESH_INTERVAL = 5.0
+STALE_AFTER = 3 * REFRESH_INTERVAL
+
+
+class SharedPlayerTable:
+    capacity: int
+    _shm: shared_memory.SharedMemory
+    _words: memoryview
+    _seqs: memoryview
+
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int):
+        self._shm = shm
+        self.capacity = capacity
+        # Every record starts with its seq, so every RECORD.size // 4-th uint32 is one
+        self._words = shm.buf.cast("I")
+        self._seqs = self._words[::RECORD.size // SEQ.size]
+
+    @classmethod
+    def create(cls, capacity: int) -> "SharedPlayerTable":
+        shm = shared_memory.SharedMemory(create=True, size=RECORD.size * capacity)
+        table = cls(shm, capacity)
+        for slot in range(capacity):
+            RECORD.pack_into(shm.buf, slot * RECORD.size, 0, 0, FREE_ID, 0.0, 0.0, 0.0, 0, 0)
+        return table
+
+    @classmethod
+    def attach(cls, name: str, capacity: int) -> "SharedPlayerTable":
+        return cls(shared_memory.SharedMemory(name=name), capacity)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def close(self, unlink: bool = False) -> None:
+        self._seqs.release()
+        self._words.release()
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+    def seq(self, slot: int) -> int:
+        return self._seqs[slot]
+
+    def write(self, slot: int, pid: int, x: float, y: float, map_name: str,
+              direction: str, last_update: float) -> None:
+        """Write a slot; only the worker owning the slot may call this."""
+        offset = slot * RECORD.size
+        seq = self._seqs[slot]
+        SEQ.pack_into(self._shm.buf, offset, (seq + 1) & 0xFFFFFFFF)
+        RECORD.pack_into(
+            self._shm.buf, offset, (seq + 1) & 0xFFFFFFFF, 0, pid, x, y, last_update,
+            protocol.MAP_IDS.get(map_name, 0), protocol.DIRECTION_IDS.get(direction, 1)
+        )
+        SEQ.pack_into(self._shm.buf, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def free(self, slot: int) -> None:
+        self.write(slot, FREE_ID, 0.0, 0.0, "", "DOWN", 0.0)
+
+    def read(self, slot: int) -> tuple[int, int, float, float, str, str, float] | None:
+        """
+        Consistent (seq, id, x, y, map, direction, last_update) of a slot, or None
+        if no consistent copy came up in READ_ATTEMPTS tries (e.g. its writer died
+        mid-write and left the seq odd); try again next tick.
+        """
+        offset = slot * RECORD.size
+        for _ in range(READ_ATTEMPTS):
+            before = self._seqs[slot]
+            if before & 1:
+                continue  # writer in progress
+            _, _, pid, x, y, last_update, map_id, direction = RECORD.unpack_from(self._shm.buf, offset)
+            if self._seqs[slot] == before:
+                return before, pid, x, y, protocol.MAP_NAMES[map_id], protocol.DIRECTIONS[direction], last_update
+        return None
+
+
+class SharedTableSync:
+    """
+    Keeps one worker's PlayerHandler and the shared table in step, once per tick:
+    the worker's own players are published into its slots, and slots written by
+    other workers are mirrored into the handler (so they show up in its
+    drain_changes() and spatial grid like local players).
+    """
+    table: SharedPlayerTable
+    _index: int
+    _workers: int
+    _own: range
+    _free: list[int]
+    # Own players: pid -> slot, and what was last published for them and when
+    _slots: dict[int, int]
+    _published: dict[int, tuple[tuple, float]]
+    # Other workers' slots: last seen seq, and the pid mirrored from each with its last_update
+    _seen: list[int]
+    _mirrored: dict[int, int]
+    _stamps: dict[int, float]
+    _last_sweep: float
+
+    def __init__(self, table: SharedPlayerTable, index: int, workers: int):
+        self.table = table
+        self._index = index
+        self._workers = workers
+        per_worker = table.capacity // workers
+        self._own = range(index * per_worker, (index + 1) * per_worker)
+        self._free = list(reversed(self._own))
+        self._slots = {}
+        self._published = {}
+        self._seen = [0] * table.capacity
+        self._mirrored = {}
+        self._stamps = {}
+        self._last_sweep = time.time()
+
+    def _is_own(self, pid: int) -> bool:
+        # Worker i hands out ids i, i + workers, i + 2 * workers, ...
+        return pid % self._workers == self._index
+
+    def sync(self, handler: PlayerHandler) -> None:
+        now = time.time()
+        self._publish(handler, now)
+        self._mirror(handler)
+        if now - self._last_sweep >= REFRESH_INTERVAL:
+            self._last_sweep = now
+            self._drop_stale(handler, now)
+
+    def _publish(self, handler: PlayerHandler, now: float) -> None:
+        for pid in [pid for pid in self._slots if pid not in handler.players]:
+            self.table.free(self._slots.pop(pid))
+            self._published.pop(pid, None)
+        for pid, x, y, map_name, direction in handler.states():
+            if not self._is_own(pid):
+                continue
+            state = (x, y, map_name, direction)
+            published = self._published.get(pid)
+            if published is not None and published[0] == state and now - published[1] < REFRESH_INTERVAL:
+                continue
+            slot = self._slots.get(pid)
+            if slot is None:
+                if not self._free:
+                    continue  # table full: player stays visible to this worker only
+                slot = self._free.pop()
+                self._slots[pid] = slot
+            self.table.write(slot, pid, x, y, map_name, direction, now)
+            self._published[pid] = (state, now)
+
+    def _mirror(self, handler: PlayerHandler) -> None:
+        table = self.table
+        seen = self._seen
+        for slot in range(table.capacity):
+            if slot in self._own or table.seq(slot) == seen[slot]:
+                continue
+            record = table.read(slot)
+            if record is None:
+                continue
+            seq, pid, x, y, map_name, direction, last_update = record
+            seen[slot] = seq
+            previous = self._mirrored.pop(slot, None)
+            self._stamps.pop(slot, None)
+            if previous is not None and previous != pid:
+                handler.unregister(previous)
+            if pid == FREE_ID:
+                continue
+            self._mirrored[slot] = pid
+            self._stamps[slot] = last_update
+            if pid in handler.players:
+                handler.update(pid, x, y, map_name, direction)
+            else:
+                handler.adopt(pid, x, y, map_name, direction)
+
+    def _drop_stale(self, handler: PlayerHandler, now: float) -> None:
+        """Unregister mirrored players whose worker stopped refreshing their slots."""
+        for slot in [slot for slot, stamp in self._stamps.items() if now - stamp > STALE_AFTER]:
+            del self._stamps[slot]
+            handler.unregister(self._mirrored.pop(slot))
@@ -0,0 +1,76 @@
+"""
+Warm-restart snapshots: the server's players and chat written to one JSON file.
+
+Capturing the state is a quick copy into plain lists on the event loop; encoding
+and writing happen on a worker thread, so the broadcast tick never waits on the
+disk. The file is written next to its final path, fsynced and then renamed over
+it, so a crash mid-write leaves the previous snapshot intact.
+"""
+import asyncio
+import json
+import os
+from typing import Callable
+
+SNAPSHOT_VERSION = 1
+# Seconds between snapshots
+SNAPSHOT_INTERVAL = 5.0
+
+
+def write_snapshot(path: str, state: dict) -> None:
+    """Atomically replace `path` with `state`; blocking, so run it off the event loop."""
+    data = json.dumps({"version": SNAPSHOT_VERSION, **state}, separators=(",", ":")).encode("utf-8")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_snapshot(path: str) -> dict | None:
+    """The state saved at `path`, or None if there is none usable."""
+    try:
+        with open(path, "rb") as f:
+            state = json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"[Server] Ignoring unreadable snapshot {path}: {e}")
+        return None
+    if state.get("version") != SNAPSHOT_VERSION:
+        print(f"[Server] Ignoring snapshot {path} with unknown version {state.get('version')}")
+        return None
+    return state
+
+
+class SnapshotWriter:
+    """Background task saving capture() to `path` every `interval` seconds."""
+    path: str
+    interval: float
+    _capture: Callable[[], dict]
+    _task: asyncio.Task | None
+
+    def __init__(self, path: str, capture: Callable[[], dict], interval: float = SNAPSHOT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._capture = capture
+        self._task = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        """Stop the task and write one last snapshot synchronously (for shutdown)."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        write_snapshot(self.path, self._capture())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            state = self._capture()
+            try:
+                await asyncio.to_thread(write_snapshot, self.path, state)
+            except OSError as e:
+                print(f"[Server] Snapshot write failed: {e}")
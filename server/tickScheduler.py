@@ -0,0 +1,58 @@
+import asyncio
+import math
+import time
+
+
+class TickScheduler:
+    """
+    Fixed-rate tick clock for the server loop.
+
+    Deadlines are absolute (start + n * interval), so time spent doing the tick's
+    work and sleep() jitter don't accumulate into drift. If a tick runs past the
+    next deadline it counts as an overrun and the missed deadlines are skipped
+    instead of being run back to back.
+    """
+    interval: float
+    ticks: int
+    overruns: int
+    skipped: int
+    # How late the most recent tick started compared to its deadline, in seconds
+    last_lateness: float
+    _deadline: float | None
+
+    def __init__(self, rate_hz: float):
+        self.interval = 1.0 / rate_hz
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.last_lateness = 0.0
+        self._deadline = None
+
+    @property
+    def rate(self) -> float:
+        return 1.0 / self.interval
+
+    def set_rate(self, rate_hz: float) -> None:
+        """Change the rate; takes effect from the next deadline on."""
+        self.interval = 1.0 / rate_hz
+
+    async def next_tick(self) -> float:
+        """Sleep until the next deadline and return it (time.monotonic() clock)."""
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now + self.interval
+        else:
+            self._deadline += self.interval
+            if now > self._deadline:
+                # Previous tick overran its budget; realign to the next free slot
+                # (strictly in the future, so the loop always yields to the writers)
+                missed = math.floor((now - self._deadline) / self.interval) + 1
+                self.overruns += 1
+                self.skipped += missed
+                self._deadline += missed * self.interval
+        delay = self._deadline - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.last_lateness = max(0.0, time.monotonic() - self._deadline)
+        self.ticks += 1
+        return self._deadline
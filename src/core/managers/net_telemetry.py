@@ -0,0 +1,149 @@
+import collections
+import csv
+import time
+from dataclasses import dataclass, fields, astuple
+from typing import Optional
+
+# Seconds between pings, which is also how often a sample is taken
+PING_INTERVAL = 1.0
+# Samples kept (one per PING_INTERVAL)
+SAMPLE_HISTORY = 300
+
+
+@dataclass
+class NetSample:
+    """Network health over one PING_INTERVAL; times in ms, traffic in bytes per second."""
+    # Seconds since the telemetry started
+    time: float
+    # Round trip of the latest ping, and the server clock minus ours from it
+    rtt: Optional[float]
+    offset: Optional[float]
+    # Smoothed variation of players frame transit times (RFC 3550)
+    jitter: float
+    # Gaps between players frames
+    interval_avg: Optional[float]
+    interval_max: Optional[float]
+    bytes_in: float
+    bytes_out: float
+    # Outgoing messages dropped because a send queue was full
+    dropped: int
+
+
+class NetTelemetry:
+    """
+    Measurements of the online connection. The network thread records traffic,
+    pongs and players frames and calls sample() every PING_INTERVAL; the game
+    thread counts drops and reads the samples. Each counter has one writer and
+    samples are only ever appended, so nothing here takes a lock.
+    """
+    samples: collections.deque[NetSample]
+    _started: float
+    _last_sample: float
+    _bytes_in: int
+    _bytes_out: int
+    _dropped_total: int
+    _dropped_sampled: int
+    _rtt: Optional[float]
+    _offset: Optional[float]
+    _jitter: float
+    _last_transit: Optional[float]
+    _last_frame: Optional[float]
+    _intervals: list[float]
+
+    def __init__(self):
+        self.samples = collections.deque(maxlen=SAMPLE_HISTORY)
+        self._started = time.monotonic()
+        self._last_sample = self._started
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._dropped_total = 0
+        self._dropped_sampled = 0
+        self._rtt = None
+        self._offset = None
+        self._jitter = 0.0
+        self._last_transit = None
+        self._last_frame = None
+        self._intervals = []
+
+    # -----------------------------
+    # Network thread
+    # -----------------------------
+    def sent(self, size: int) -> None:
+        self._bytes_out += size
+
+    def received(self, size: int) -> None:
+        self._bytes_in += size
+
+    def connected(self) -> None:
+        """A new connection: frames on the old one say nothing about the gaps on this one."""
+        self._last_transit = None
+        self._last_frame = None
+
+    def ping(self) -> dict:
+        """The ping message to send now; the server echoes "t" back in a pong."""
+        return {"type": "ping", "t": time.monotonic()}
+
+    def pong(self, data: dict) -> None:
+        now = time.monotonic()
+        rtt = now - float(data.get("t", now))
+        self._rtt = rtt * 1000
+        # The server answered halfway through the round trip
+        self._offset = (float(data.get("server_time", 0.0)) - (time.time() - rtt / 2)) * 1000
+
+    def players_frame(self, server_time: float) -> None:
+        now = time.monotonic()
+        # Our clock and the server's differ by a constant, which cancels out in the differences
+        transit = now - server_time
+        if self._last_transit is not None:
+            self._jitter += (abs(transit - self._last_transit) * 1000 - self._jitter) / 16
+        self._last_transit = transit
+        if self._last_frame is not None:
+            self._intervals.append((now - self._last_frame) * 1000)
+        self._last_frame = now
+
+    def sample(self) -> NetSample:
+        """Close the current interval and add its sample."""
+        now = time.monotonic()
+        elapsed = max(now - self._last_sample, 1e-6)
+        intervals = self._intervals
+        dropped = self._dropped_total
+        sample = NetSample(
+            time=now - self._started,
+            rtt=self._rtt,
+            offset=self._offset,
+            jitter=self._jitter,
+            interval_avg=sum(intervals) / len(intervals) if intervals else None,
+            interval_max=max(intervals) if intervals else None,
+            bytes_in=self._bytes_in / elapsed,
+            bytes_out=self._bytes_out / elapsed,
+            dropped=dropped - self._dropped_sampled,
+        )
+        self._last_sample = now
+        self._bytes_in = self._bytes_out = 0
+        self._dropped_sampled = dropped
+        self._intervals = []
+        # deque.append is atomic, so readers never see a half-added sample
+        self.samples.append(sample)
+        return sample
+
+    # -----------------------------
+    # Game thread
+    # -----------------------------
+    def dropped(self) -> None:
+        self._dropped_total += 1
+
+    def latest(self) -> Optional[NetSample]:
+        try:
+            return self.samples[-1]
+        except IndexError:
+            return None
+
+    def dump_csv(self, path: str) -> int:
+        """Write every kept sample to a CSV file; the number of rows written."""
+        samples = list(self.samples)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow([field.name for field in fields(NetSample)])
+            for s in samples:
+                writer.writerow(["" if v is None else round(v, 3) for v in astuple(s)])
+        return len(samples)
@@ -7,6 +7,8 @@ import json
 from collections import deque
 from typing import Optional
 from src.utils import Logger, GameSettings
+from src.core.managers.net_telemetry import NetTelemetry, PING_INTERVAL
+from server import protocol
 
 try:
     import websockets
@@ -16,6 +18,49 @@ except ImportError:
 
 from typing import Any
 
+# Most position updates we send per second; other clients interpolate between them
+UPDATE_RATE = 20
+# While standing still, our position is resent this often to show we're still here
+HEARTBEAT_INTERVAL = 5.0
+# Remote players are drawn this far in the past (server time), so there are usually
+# two snapshots around the drawn moment to interpolate between
+RENDER_DELAY = 0.1
+# Snapshots kept per remote player
+SNAPSHOT_HISTORY = 16
+# How far past its newest snapshot a player may keep moving. Deltas leave out players
+# that didn't move, so one with no snapshot for longer than its last step took is
+# taken to have stopped and is held at its newest position
+MAX_EXTRAPOLATION = 0.1
+# Moves longer than this between two snapshots are teleports and aren't interpolated
+TELEPORT_DISTANCE = 256.0
+
+# (server timestamp, x, y, map, direction)
+Snapshot = tuple[float, float, float, str, str]
+
+
+class RemotePlayers:
+    """
+    The remote players as of one players frame. The network thread builds a
+    new one after every frame and publishes it with a single assignment; it is
+    never modified afterwards, so the game thread reads it without the lock.
+    Its lists and player dicts are shared with later snapshots: read-only.
+    """
+    __slots__ = ("players", "by_map", "history")
+    players: list[dict]
+    # The same player dicts, per map
+    by_map: dict[str, list[dict]]
+    # Recent snapshots per player, oldest first
+    history: dict[int, tuple[Snapshot, ...]]
+
+    def __init__(self, players: list[dict], by_map: dict[str, list[dict]],
+                 history: dict[int, tuple[Snapshot, ...]]):
+        self.players = players
+        self.by_map = by_map
+        self.history = history
+
+
+NO_PLAYERS = RemotePlayers([], {}, {})
+
 
 class OnlineManager:
     list_players: list[dict]
@@ -26,12 +71,41 @@ class OnlineManager:
     _ws_thread: Optional[threading.Thread]
     _stop_event: threading.Event
     _lock: threading.Lock
-    _update_queue: queue.Queue
+    # Latest (x, y, map, direction) from the game thread; the sender only sends it when it changes
+    _position: Optional[tuple[float, float, str, str]]
+    # Set (via _notify) when there is something to send; created on the network loop
+    _wakeup: Optional[asyncio.Event]
     _chat_out_queue: queue.Queue
     _chat_messages: collections.deque
     _last_chat_id: int
-
-    def __init__(self):
+    # Token from "registered" that gets our id back after a reconnect
+    _resume_token: Optional[str]
+    # Chat channels to receive ("global", "map", "proximity"); sent as chat_subscribe
+    _chat_channels: list[str]
+    _chat_channels_dirty: bool
+    # Seconds remote players are drawn behind the server (see get_interpolated_players)
+    render_delay: float
+    # What the game thread reads; replaced as a whole after every players frame
+    _remote: RemotePlayers
+    # Players frame state, only touched by the network thread. A player's dict is
+    # replaced rather than changed when they move, since _remote may share it
+    _players: dict[int, dict]
+    _map_players: dict[str, dict[int, dict]]
+    # Maps whose players changed since the last publish
+    _dirty_maps: set[str]
+    # Recent snapshots per remote player, oldest first; players whose newest one was a move
+    _history: dict[int, tuple[Snapshot, ...]]
+    _moving: set[int]
+    # Estimated server clock minus our monotonic clock
+    _clock_offset: Optional[float]
+    _players_seq: int
+    _resync_pending: bool
+    # Position traffic uses server.protocol binary frames on this connection
+    _binary: bool
+    # RTT, jitter, traffic and drops, sampled every PING_INTERVAL (see NetGraph)
+    telemetry: NetTelemetry
+
+    def __init__(self, render_delay: float = RENDER_DELAY):
         if websockets is None:
             Logger.error("WebSockets library not available")
             raise ImportError("websockets library required")
@@ -52,10 +126,26 @@ class OnlineManager:
         self._ws_thread = None
         self._stop_event = threading.Event()
         self._lock = threading.Lock()
-        self._update_queue = queue.Queue(maxsize=10)
+        self._position = None
+        self._wakeup = None
         self._chat_out_queue = queue.Queue(maxsize=50)
         self._chat_messages = deque(maxlen=200)
         self._last_chat_id = 0
+        self._resume_token = None
+        self._chat_channels = ["global"]
+        self._chat_channels_dirty = False
+        self.render_delay = render_delay
+        self._remote = NO_PLAYERS
+        self._players = {}
+        self._map_players = {}
+        self._dirty_maps = set()
+        self._history = {}
+        self._moving = set()
+        self._clock_offset = None
+        self._players_seq = -1
+        self._resync_pending = False
+        self._binary = False
+        self.telemetry = NetTelemetry()
 
         Logger.info("OnlineManager initialized")
 
@@ -66,26 +156,59 @@ class OnlineManager:
         self.stop()
 
     def get_list_players(self) -> list[dict]:
-        """Get list of players"""
-        with self._lock:
-            return list(self.list_players)
+        """Get list of players (read-only: it is shared until the next players frame)"""
+        return self._remote.players
+
+    def get_players_on_map(self, map_name: str) -> list[dict]:
+        """The remote players on one map (read-only, like get_list_players)."""
+        return self._remote.by_map.get(map_name, [])
+
+    def get_interpolated_players(self, map_name: Optional[str] = None) -> list[dict]:
+        """
+        Remote players as they were render_delay ago on the server, interpolated
+        between the snapshots around that moment (same shape as get_list_players),
+        optionally only those on map_name. Drawing these instead of the latest
+        positions hides the gaps between network updates.
+        """
+        remote = self._remote
+        players = remote.players if map_name is None else remote.by_map.get(map_name, [])
+        offset = self._clock_offset
+        if offset is None:
+            return players
+        t = time.monotonic() + offset - self.render_delay
+        result = []
+        for p in players:
+            history = remote.history.get(p["id"])
+            sample = self._sample(p["id"], history, t) if history else None
+            if sample is None:
+                result.append(p)  # standing where the latest frame has them
+            elif map_name is None or sample["map"] == map_name:
+                result.append(sample)
+        return result
 
     def update(self, x: float, y: float, map_name: str, direction: str = "DOWN") -> bool:
-        """Queue position update (no dir / moving)."""
+        """Set our position; called every frame, but only a change wakes the network thread."""
         if self.player_id == -1:
             return False
+        # HINT: This part might be helpful for direction change
+        # Maybe you can add other parameters?
+        position = (x, y, map_name, direction)
+        if position != self._position:
+            self._position = position
+            self._notify()
+        return True
+
+    def _notify(self) -> None:
+        """Wake the sender from the game thread."""
+        loop = self._ws_loop
+        wakeup = self._wakeup
+        # Already set means the sender hasn't flushed yet and will see our change when it does
+        if loop is None or wakeup is None or wakeup.is_set():
+            return
         try:
-            # HINT: This part might be helpful for direction change
-            # Maybe you can add other parameters?
-            self._update_queue.put_nowait({
-                "x": x,
-                "y": y,
-                "map": map_name,
-                "direction": direction,
-            })
-            return True
-        except queue.Full:
-            return False
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            pass  # loop is shutting down
 
     def start(self) -> None:
         if self._ws_thread and self._ws_thread.is_alive():
@@ -112,6 +235,7 @@ class OnlineManager:
         """Run WebSocket event loop in a separate thread"""
         self._ws_loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self._ws_loop)
+        self._wakeup = asyncio.Event()
         try:
             self._ws_loop.run_until_complete(self._ws_main())
         except Exception as e:
@@ -119,6 +243,7 @@ class OnlineManager:
         finally:
             self._ws_loop.close()
             self._ws_loop = None
+            self._wakeup = None
 
     async def _close_ws(self) -> None:
         """Close WebSocket connection"""
@@ -140,30 +265,58 @@ class OnlineManager:
                 async with websockets.connect(
                     self.ws_url,
                     ping_interval=20,
-                    ping_timeout=10
+                    ping_timeout=10,
+                    subprotocols=[protocol.BINARY_SUBPROTOCOL]
                 ) as websocket:
                     self._ws = websocket
-                    Logger.info("WebSocket connected")
+                    self._binary = websocket.subprotocol == protocol.BINARY_SUBPROTOCOL
+                    Logger.info(f"WebSocket connected ({'binary' if self._binary else 'json'})")
                     reconnect_delay = 1.0  # Reset delay on successful connection
 
-                    # Start sender task
-                    sender_task = asyncio.create_task(self._ws_sender(websocket))
+                    # Ask for players_delta frames; the server answers with a keyframe
+                    self.telemetry.connected()
+                    self._clock_offset = None
+                    self._players_seq = -1
+                    self._resync_pending = False
+                    hello = {
+                        "type": "hello",
+                        "features": ["delta"]
+                    }
+                    if self._resume_token:
+                        # Ask for our old id back, and only the chat we missed
+                        hello["resume_token"] = self._resume_token
+                        hello["last_chat_id"] = self._last_chat_id
+                    await self._send(websocket, json.dumps(hello))
+                    # A new connection starts on the server's default channels
+                    self._chat_channels_dirty = self._chat_channels != ["global"]
+
+                    # Start sender and pinger tasks
+                    tasks = [
+                        asyncio.create_task(self._ws_sender(websocket)),
+                        asyncio.create_task(self._ws_pinger(websocket)),
+                    ]
 
                     # Handle incoming messages
                     try:
                         async for message in websocket:
                             if self._stop_event.is_set():
                                 break
+                            self.telemetry.received(len(message))
                             await self._handle_message(message)
                     except websockets.exceptions.ConnectionClosed:
                         Logger.warning("WebSocket connection closed")
                     finally:
-                        sender_task.cancel()
-                        try:
-                            await sender_task
-                        except asyncio.CancelledError:
-                            pass
-
+                        for task in tasks:
+                            task.cancel()
+                        await asyncio.gather(*tasks, return_exceptions=True)
+
+            except websockets.exceptions.InvalidStatus as e:
+                # Turned away (server full): wait as long as it asks
+                retry_after = e.response.headers.get("Retry-After", "")
+                delay = float(retry_after) if retry_after.isdigit() else reconnect_delay
+                Logger.warning(f"WebSocket rejected ({e.response.status_code}), reconnecting in {delay}s")
+                await asyncio.sleep(delay)
+                reconnect_delay = min(reconnect_delay * 2, max_reconnect_delay)
             except Exception as e:
                 Logger.warning(f"WebSocket connection error: {e}, reconnecting in {reconnect_delay}s")
                 await asyncio.sleep(reconnect_delay)
@@ -173,43 +326,79 @@ class OnlineManager:
                 if not self._stop_event.is_set():
                     await asyncio.sleep(0.5)
 
-    async def _handle_message(self, message: str) -> None:
+    async def _handle_message(self, message: str | bytes) -> None:
         """Handle incoming WebSocket message"""
         try:
-            data = json.loads(message)
+            if isinstance(message, bytes):
+                data = protocol.decode_frame(message)
+            else:
+                data = json.loads(message)
             msg_type = data.get("type")
 
             if msg_type == "registered":
                 self.player_id = int(data.get("id", -1))
-                Logger.info(f"OnlineManager registered with id={self.player_id}")
+                self._resume_token = data.get("token")
+                if not data.get("resumed"):
+                    # New identity: the server sends its recent chat from scratch
+                    with self._lock:
+                        self._chat_messages.clear()
+                        self._last_chat_id = 0
+                Logger.info(f"OnlineManager registered with id={self.player_id}"
+                            f"{' (resumed)' if data.get('resumed') else ''}")
+                # Anything held back while unregistered can go out now
+                self._wakeup.set()
 
             elif msg_type == "players_update":
                 players_data = data.get("players", {})
-                with self._lock:
-                    filtered = []
-                    for pid_str, player_data in players_data.items():
-                        pid = int(pid_str)
-                        if pid != self.player_id:
-
-                            # HINT: This part might be helpful for direction change
-                            # Maybe you can add other parameters?
-                            filtered.append({
-                                "id": pid,
-                                "x": float(player_data.get("x", 0)),
-                                "y": float(player_data.get("y", 0)),
-                                "map": str(player_data.get("map", "")),
-                                "direction": str(player_data.get("direction", "DOWN")),
-                            })
-                    self.list_players = filtered
+                timestamp = self._observe_clock(data)
+                self.telemetry.players_frame(timestamp)
+                changed = []
+                present = set()
+                for pid_str, player_data in players_data.items():
+                    pid = int(pid_str)
+                    present.add(pid)
+                    if self._store_player(pid, player_data):
+                        changed.append(pid)
+                # A keyframe lists everyone we can see; forget the rest
+                for pid in [pid for pid in self._players if pid not in present]:
+                    self._forget_player(pid)
+                pinned = self._record_snapshots(timestamp, changed, keyframe=True)
+                self._players_seq = int(data.get("seq", -1))
+                self._resync_pending = False
+                self._publish_players(pinned)
+
+            elif msg_type == "players_delta":
+                if int(data.get("base", -1)) != self._players_seq:
+                    # Missed a frame; drop deltas until the server sends a keyframe
+                    if not self._resync_pending and self._ws is not None:
+                        self._resync_pending = True
+                        await self._send(self._ws, json.dumps({"type": "players_resync"}))
+                    return
+                timestamp = self._observe_clock(data)
+                self.telemetry.players_frame(timestamp)
+                changed = []
+                for pid_str, player_data in data.get("changed", {}).items():
+                    pid = int(pid_str)
+                    if self._store_player(pid, player_data):
+                        changed.append(pid)
+                for pid in data.get("removed", []):
+                    self._forget_player(int(pid))
+                pinned = self._record_snapshots(timestamp, changed, keyframe=False)
+                self._players_seq = int(data.get("seq", -1))
+                self._publish_players(pinned)
 
             elif msg_type == "chat_update":
                 messages = data.get("messages", [])
                 with self._lock:
                     for m in messages:
+                        mid = int(m.get("id", self._last_chat_id + 1))
+                        if mid <= self._last_chat_id:
+                            continue  # already have it
                         self._chat_messages.append(m)
-                        mid = int(m.get("id", self._last_chat_id))
-                        if mid > self._last_chat_id:
-                            self._last_chat_id = mid
+                        self._last_chat_id = mid
+
+            elif msg_type == "pong":
+                self.telemetry.pong(data)
 
             elif msg_type == "error":
                 Logger.warning(f"Server error: {data.get('message', 'unknown')}")
@@ -219,69 +408,251 @@ class OnlineManager:
         except Exception as e:
             Logger.warning(f"Error handling WebSocket message: {e}")
 
+    # -----------------------------
+    # Remote players
+    # -----------------------------
+    def _store_player(self, pid: int, player_data: dict) -> bool:
+        """Take one player from a players frame; whether anything about them changed."""
+        if pid == self.player_id:
+            return False
+        # HINT: This part might be helpful for direction change
+        # Maybe you can add other parameters?
+        x = float(player_data.get("x", 0))
+        y = float(player_data.get("y", 0))
+        map_name = str(player_data.get("map", ""))
+        direction = str(player_data.get("direction", "DOWN"))
+        old = self._players.get(pid)
+        if old is not None:
+            if old["x"] == x and old["y"] == y and old["map"] == map_name and old["direction"] == direction:
+                return False
+            if old["map"] != map_name:
+                self._unindex_player(pid, old["map"])
+        # A new dict, never an update in place: the published snapshot may hold the old one
+        player = {"id": pid, "x": x, "y": y, "map": map_name, "direction": direction}
+        self._players[pid] = player
+        self._map_players.setdefault(map_name, {})[pid] = player
+        self._dirty_maps.add(map_name)
+        return True
+
+    def _forget_player(self, pid: int) -> None:
+        old = self._players.pop(pid, None)
+        if old is not None:
+            self._unindex_player(pid, old["map"])
+        self._history.pop(pid, None)
+        self._moving.discard(pid)
+
+    def _unindex_player(self, pid: int, map_name: str) -> None:
+        members = self._map_players.get(map_name)
+        if members is not None:
+            members.pop(pid, None)
+            if not members:
+                del self._map_players[map_name]
+        self._dirty_maps.add(map_name)
+
+    def _publish_players(self, pinned: bool) -> None:
+        """Hand the game thread a new RemotePlayers; lists of untouched maps are reused."""
+        previous = self._remote
+        if not self._dirty_maps and not pinned:
+            return
+        by_map = dict(previous.by_map)
+        for map_name in self._dirty_maps:
+            members = self._map_players.get(map_name)
+            if members:
+                by_map[map_name] = list(members.values())
+            else:
+                by_map.pop(map_name, None)
+        players = list(self._players.values()) if self._dirty_maps else previous.players
+        self._dirty_maps.clear()
+        # History tuples are replaced, never extended, so a shallow copy is a stable view
+        self._remote = RemotePlayers(players, by_map, dict(self._history))
+        self.list_players = players
+
+    # -----------------------------
+    # Interpolation
+    # -----------------------------
+    def _observe_clock(self, data: dict) -> float:
+        """Server timestamp of a players frame, also refining the clock offset estimate."""
+        timestamp = float(data.get("timestamp", 0.0))
+        sample = timestamp - time.monotonic()
+        # The least delayed frames give the best estimate: jump up to those, drift down slowly
+        if self._clock_offset is None or sample > self._clock_offset:
+            self._clock_offset = sample
+        else:
+            self._clock_offset += (sample - self._clock_offset) * 0.01
+        return timestamp
+
+    def _record_snapshots(self, timestamp: float, changed: list[int], keyframe: bool) -> bool:
+        """
+        Add a snapshot for every player in `changed`, whose dicts are already
+        stored; whether any other player's history was touched too.
+        """
+        for pid in changed:
+            p = self._players[pid]
+            history = self._history.get(pid, ())
+            last = history[-1] if history else None
+            self._history[pid] = history[1 - SNAPSHOT_HISTORY:] + (
+                (timestamp, p["x"], p["y"], p["map"], p["direction"]),)
+            if last is not None and (last[1], last[2], last[3]) != (p["x"], p["y"], p["map"]):
+                self._moving.add(pid)
+            else:
+                self._moving.discard(pid)
+        # Players left out of a keyframe stood still: pin them so they aren't extrapolated.
+        # A delta says nothing about them, the server may be holding back far players' moves
+        if not keyframe or not self._moving:
+            return False
+        changed = set(changed)
+        stopped = [pid for pid in self._moving if pid not in changed]
+        for pid in stopped:
+            history = self._history[pid]
+            self._history[pid] = history[1 - SNAPSHOT_HISTORY:] + ((timestamp,) + history[-1][1:],)
+            self._moving.discard(pid)
+        return bool(stopped)
+
+    @staticmethod
+    def _sample(pid: int, history: tuple[Snapshot, ...], t: float) -> Optional[dict]:
+        """Where the player was at server time t; None if that is their newest snapshot."""
+        newest = history[-1]
+        if t >= newest[0] or len(history) == 1:
+            # Past the newest snapshot: keep going along the last move for a moment
+            if len(history) == 1:
+                return None
+            previous = history[-2]
+            span = newest[0] - previous[0]
+            ahead = t - newest[0]
+            if span <= 0 or previous[1:4] == newest[1:4] or ahead > min(span, MAX_EXTRAPOLATION):
+                return None
+            return OnlineManager._player_at(pid, previous, newest, 1.0 + ahead / span)
+        for i in range(len(history) - 1, 0, -1):
+            a = history[i - 1]
+            if a[0] <= t:
+                b = history[i]
+                span = b[0] - a[0]
+                return OnlineManager._player_at(pid, a, b, (t - a[0]) / span if span > 0 else 1.0)
+        # Older than anything we have
+        return OnlineManager._player_at(pid, history[0], history[0], 0.0)
+
+    @staticmethod
+    def _player_at(pid: int, a: Snapshot, b: Snapshot, f: float) -> dict:
+        """Player dict at fraction f of the way from snapshot a to b (f > 1 extrapolates)."""
+        dx = b[1] - a[1]
+        dy = b[2] - a[2]
+        if a[3] != b[3] or dx * dx + dy * dy > TELEPORT_DISTANCE * TELEPORT_DISTANCE:
+            f = 1.0  # changed map or teleported: no sliding across
+        return {
+            "id": pid,
+            "x": a[1] + dx * f,
+            "y": a[2] + dy * f,
+            "map": b[3],
+            "direction": b[4],
+        }
+
     async def _ws_sender(self, websocket: Any) -> None:
-        """Send updates to server via WebSocket"""
-        update_interval = 0.0167  # 60 updates per second
-        last_update = time.monotonic()
+        """
+        Send our position and chat whenever the game thread signals a change.
+        Positions go out at most UPDATE_RATE times a second, and while standing
+        still only every HEARTBEAT_INTERVAL; queued chat rides the same flush.
+        """
+        last_position = None
+        last_sent = 0.0
+        # A new connection gets our current position right away
+        self._wakeup.set()
 
         while not self._stop_event.is_set():
             try:
-                # Send position updates
-                now = time.monotonic()
-                if now - last_update >= update_interval:
-                    # Collapse queue to latest entry to avoid sending stale movement
-                    latest_update = None
-                    try:
-                        while True:
-                            latest_update = self._update_queue.get_nowait()
-                    except queue.Empty:
-                        pass
-
-                    if latest_update and self.player_id >= 0:
-                        # HINT: This part might be helpful for direction change
-                        # Maybe you can add other parameters? 
-                        message = {
-                            "type": "player_update",
-                            "x": latest_update.get("x"),
-                            "y": latest_update.get("y"),
-                            "map": latest_update.get("map"),
-                            "direction": latest_update.get("direction", "DOWN"),
-                        }
-                        await websocket.send(json.dumps(message))
-                        last_update = now
-
-                # Send chat messages
                 try:
-                    chat_text = self._chat_out_queue.get_nowait()
-                    if self.player_id >= 0:
-                        message = {
-                            "type": "chat_send",
-                            "text": chat_text
-                        }
-                        await websocket.send(json.dumps(message))
-                except queue.Empty:
+                    await asyncio.wait_for(self._wakeup.wait(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
                     pass
+                # Changes made while we wait out the rate cap are folded into this flush
+                delay = last_sent + 1.0 / UPDATE_RATE - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._wakeup.clear()
+                if self.player_id < 0:
+                    continue  # "registered" wakes us again
 
-                await asyncio.sleep(0.01)  # Small sleep to prevent busy waiting
+                now = time.monotonic()
+                position = self._position
+                if position is not None and (position != last_position
+                                             or now - last_sent >= HEARTBEAT_INTERVAL):
+                    await self._send(websocket, self._position_frame(position))
+                    last_position = position
+                    last_sent = now
+
+                # Send chat subscriptions and messages
+                if self._chat_channels_dirty:
+                    self._chat_channels_dirty = False
+                    await self._send(websocket, json.dumps({
+                        "type": "chat_subscribe",
+                        "channels": list(self._chat_channels)
+                    }))
+                while True:
+                    try:
+                        chat_text, channel = self._chat_out_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    await self._send(websocket, json.dumps({
+                        "type": "chat_send",
+                        "text": chat_text,
+                        "channel": channel
+                    }))
 
             except Exception as e:
                 Logger.warning(f"WebSocket send error: {e}")
                 await asyncio.sleep(0.1)
 
+    async def _ws_pinger(self, websocket: Any) -> None:
+        """Ping the server (it answers with a pong) and take a telemetry sample every PING_INTERVAL."""
+        while not self._stop_event.is_set():
+            await asyncio.sleep(PING_INTERVAL)
+            self.telemetry.sample()
+            try:
+                await self._send(websocket, json.dumps(self.telemetry.ping()))
+            except websockets.exceptions.ConnectionClosed:
+                return
+
+    async def _send(self, websocket: Any, frame: str | bytes) -> None:
+        self.telemetry.sent(len(frame))
+        await websocket.send(frame)
+
+    def _position_frame(self, position: tuple[float, float, str, str]) -> str | bytes:
+        x, y, map_name, direction = position
+        frame = None
+        if self._binary:
+            frame = protocol.encode_player_update(x, y, map_name, direction)
+        if frame is None:
+            frame = json.dumps({
+                "type": "player_update",
+                "x": x,
+                "y": y,
+                "map": map_name,
+                "direction": direction,
+            })
+        return frame
+
     # -----------------------------
     # Chat API
     # -----------------------------
-    def send_chat(self, text: str) -> bool:
+    def send_chat(self, text: str, channel: str = "global") -> bool:
+        """Queue a message for "global", "map" (sender's map) or "proximity" (nearby players)."""
         if self.player_id == -1:
             return False
         t = (text or "").strip()
         if not t:
             return False
         try:
-            self._chat_out_queue.put_nowait(t)
-            return True
+            self._chat_out_queue.put_nowait((t, channel))
         except queue.Full:
+            self.telemetry.dropped()
             return False
+        self._notify()
+        return True
+
+    def set_chat_channels(self, channels: list[str]) -> None:
+        """Choose which channels' messages the server sends us (own messages always come back)."""
+        self._chat_channels = list(channels)
+        self._chat_channels_dirty = True
+        self._notify()
 
     def get_recent_chat(self, limit: int = 50) -> list[dict]:
         with self._lock:
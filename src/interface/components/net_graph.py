@@ -0,0 +1,89 @@
+from __future__ import annotations
+import pygame as pg
+
+from src.core.managers.net_telemetry import NetTelemetry, NetSample
+from typing import override
+from .component import UIComponent
+
+# Samples (seconds) shown in the graph
+GRAPH_SAMPLES = 60
+RTT_COLOR = (90, 220, 90)
+INTERVAL_COLOR = (240, 200, 60)
+
+
+def _ms(value: float | None) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+
+class NetGraph(UIComponent):
+    """Toggleable overlay with the latest network numbers and a graph of RTT and players frame gaps."""
+    telemetry: NetTelemetry
+    rect: pg.Rect
+    visible: bool
+    _font: pg.font.Font
+    # Re-rendered only when a new sample comes in (once a second)
+    _surface: pg.Surface | None
+    _rendered: NetSample | None
+
+    def __init__(self, telemetry: NetTelemetry, x: int, y: int, width: int = 340, height: int = 180):
+        self.telemetry = telemetry
+        self.rect = pg.Rect(x, y, width, height)
+        self.visible = False
+        self._font = pg.font.Font("assets/fonts/Minecraft.ttf", 14)
+        self._surface = None
+        self._rendered = None
+
+    def toggle(self) -> None:
+        self.visible = not self.visible
+        self._rendered = None
+
+    @override
+    def update(self, dt: float) -> None:
+        if not self.visible:
+            return
+        latest = self.telemetry.latest()
+        if self._surface is None or latest is not self._rendered:
+            self._surface = self._render(latest)
+            self._rendered = latest
+
+    @override
+    def draw(self, screen: pg.Surface) -> None:
+        if self.visible and self._surface is not None:
+            screen.blit(self._surface, self.rect.topleft)
+
+    def _render(self, latest: NetSample | None) -> pg.Surface:
+        surface = pg.Surface(self.rect.size, pg.SRCALPHA)
+        surface.fill((0, 0, 0, 170))
+        if latest is None:
+            lines = ["net: waiting for samples"]
+        else:
+            lines = [
+                f"rtt {_ms(latest.rtt)} ms  offset {_ms(latest.offset)} ms  jitter {latest.jitter:.1f} ms",
+                f"frames every {_ms(latest.interval_avg)} ms (max {_ms(latest.interval_max)})",
+                f"in {latest.bytes_in / 1024:.1f} KiB/s  out {latest.bytes_out / 1024:.1f} KiB/s"
+                f"  dropped {latest.dropped}",
+            ]
+        y = 6
+        for line in lines:
+            surface.blit(self._font.render(line, True, (255, 255, 255)), (8, y))
+            y += 18
+
+        # RTT and the longest frame gap of each second, on one scale
+        graph = pg.Rect(8, y + 4, self.rect.width - 16, self.rect.height - y - 12)
+        pg.draw.rect(surface, (255, 255, 255, 60), graph, 1)
+        samples = list(self.telemetry.samples)[-GRAPH_SAMPLES:]
+        values = [v for s in samples for v in (s.rtt, s.interval_max) if v is not None]
+        top = max([100.0] + values)
+        surface.blit(self._font.render(f"{top:.0f} ms", True, (200, 200, 200)), (graph.right - 60, graph.top + 2))
+        surface.blit(self._font.render("rtt", True, RTT_COLOR), (graph.left + 4, graph.top + 2))
+        surface.blit(self._font.render("frame gap", True, INTERVAL_COLOR), (graph.left + 36, graph.top + 2))
+        step = graph.width / max(GRAPH_SAMPLES - 1, 1)
+        for key, color in (("rtt", RTT_COLOR), ("interval_max", INTERVAL_COLOR)):
+            points = [
+                (graph.left + i * step, graph.bottom - 1 - getattr(s, key) / top * (graph.height - 2))
+                for i, s in enumerate(samples)
+                if getattr(s, key) is not None
+            ]
+            if len(points) > 1:
+                pg.draw.lines(surface, color, False, points)
+        return surface
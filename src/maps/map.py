@@ -3,6 +3,9 @@ import pytmx
 
 from src.utils import load_tmx, Position, GameSettings, PositionCamera, Teleport
 
+# The baked map is split into square chunks this many tiles wide; draw() only blits the visible ones
+CHUNK_TILES = 8
+
 class Map:
     # Map Properties
     path_name: str
@@ -11,7 +14,10 @@ class Map:
     spawn: Position
     teleporters: list[Teleport]
     # Rendering Properties
-    _surface: pg.Surface
+    pixel_size: tuple[int, int]
+    # [row][column]; None where the chunk has nothing on it
+    _chunks: list[list[pg.Surface | None]]
+    _minimaps: dict[int, pg.Surface]
     _collision_map: list[pg.Rect]
 
     def __init__(self, path: str, tp: list[Teleport], spawn: Position):
@@ -23,9 +29,10 @@ class Map:
         pixel_w = self.tmxdata.width * GameSettings.TILE_SIZE
         pixel_h = self.tmxdata.height * GameSettings.TILE_SIZE
 
-        # Prebake the map
-        self._surface = pg.Surface((pixel_w, pixel_h), pg.SRCALPHA)
-        self._render_all_layers(self._surface)
+        # Prebake the map, in chunks
+        self.pixel_size = (pixel_w, pixel_h)
+        self._chunks = self._render_all_layers()
+        self._minimaps = {}
         # Prebake the collision map
         self._collision_map = self._create_collision_map()
         # Prebake the bush map
@@ -35,7 +42,18 @@ class Map:
         return
 
     def draw(self, screen: pg.Surface, camera: PositionCamera):
-        screen.blit(self._surface, camera.transform_position(Position(0, 0)))
+        # Only the chunks overlapping the screen: the cost follows the screen size, not the map's
+        ox, oy = camera.transform_position(Position(0, 0))
+        size = CHUNK_TILES * GameSettings.TILE_SIZE
+        width, height = screen.get_size()
+        rows = range(max(0, -oy // size), min(len(self._chunks), (height - 1 - oy) // size + 1))
+        cols = range(max(0, -ox // size), min(len(self._chunks[0]) if self._chunks else 0, (width - 1 - ox) // size + 1))
+        screen.blits([
+            (chunk, (ox + col * size, oy + row * size))
+            for row in rows
+            for col in cols
+            if (chunk := self._chunks[row][col]) is not None
+        ], doreturn=False)
         
         # Draw the hitboxes collision map
         if GameSettings.DRAW_HITBOXES:
@@ -71,23 +89,69 @@ class Map:
                 return teleporter
         return None
 
-    def _render_all_layers(self, target: pg.Surface) -> None:
+    def get_minimap(self, size: int) -> pg.Surface:
+        """The whole map scaled to fit in a size x size square (cached per size)."""
+        minimap = self._minimaps.get(size)
+        if minimap is None:
+            scale = min(size / self.pixel_size[0], size / self.pixel_size[1])
+            minimap = pg.Surface((int(self.pixel_size[0] * scale), int(self.pixel_size[1] * scale)), pg.SRCALPHA)
+            chunk_size = CHUNK_TILES * GameSettings.TILE_SIZE
+            for row, chunks in enumerate(self._chunks):
+                for col, chunk in enumerate(chunks):
+                    if chunk is None:
+                        continue
+                    # From scaled edges rather than scaled sizes, so rounding leaves no seams
+                    left, top = int(col * chunk_size * scale), int(row * chunk_size * scale)
+                    right = int((col * chunk_size + chunk.get_width()) * scale)
+                    bottom = int((row * chunk_size + chunk.get_height()) * scale)
+                    if right > left and bottom > top:
+                        minimap.blit(pg.transform.scale(chunk, (right - left, bottom - top)), (left, top))
+            self._minimaps[size] = minimap
+        return minimap
+
+    def _render_all_layers(self) -> list[list[pg.Surface | None]]:
+        cols = -(-self.tmxdata.width // CHUNK_TILES)
+        rows = -(-self.tmxdata.height // CHUNK_TILES)
+        chunks: list[list[pg.Surface | None]] = [[None] * cols for _ in range(rows)]
+        tiles: dict[int, pg.Surface] = {}
         for layer in self.tmxdata.visible_layers:
             if isinstance(layer, pytmx.TiledTileLayer):
-                self._render_tile_layer(target, layer)
+                self._render_tile_layer(chunks, layer, tiles)
             # elif isinstance(layer, pytmx.TiledImageLayer) and layer.image:
             #     target.blit(layer.image, (layer.x or 0, layer.y or 0))
+
+        # Chunks the layers cover completely need no alpha: those blit several times faster
+        can_convert = pg.display.get_surface() is not None
+        for row in chunks:
+            for col, chunk in enumerate(row):
+                if chunk is None or not can_convert:
+                    continue
+                w, h = chunk.get_size()
+                opaque = pg.mask.from_surface(chunk, 254).count() == w * h
+                row[col] = chunk.convert() if opaque else chunk.convert_alpha()
+        return chunks
  
-    def _render_tile_layer(self, target: pg.Surface, layer: pytmx.TiledTileLayer) -> None:
+    def _render_tile_layer(self, chunks: list[list[pg.Surface | None]], layer: pytmx.TiledTileLayer,
+                           tiles: dict[int, pg.Surface]) -> None:
+        tile_size = GameSettings.TILE_SIZE
         for x, y, gid in layer:
             if gid == 0:
                 continue
-            image = self.tmxdata.get_tile_image_by_gid(gid)
+            image = tiles.get(gid)
             if image is None:
-                continue
+                image = self.tmxdata.get_tile_image_by_gid(gid)
+                if image is None:
+                    continue
+                image = tiles[gid] = pg.transform.scale(image, (tile_size, tile_size))
 
-            image = pg.transform.scale(image, (GameSettings.TILE_SIZE, GameSettings.TILE_SIZE))
-            target.blit(image, (x * GameSettings.TILE_SIZE, y * GameSettings.TILE_SIZE))
+            row, col = y // CHUNK_TILES, x // CHUNK_TILES
+            chunk = chunks[row][col]
+            if chunk is None:
+                # Chunks on the right and bottom edges are cut to the map size
+                w = min(CHUNK_TILES, self.tmxdata.width - col * CHUNK_TILES) * tile_size
+                h = min(CHUNK_TILES, self.tmxdata.height - row * CHUNK_TILES) * tile_size
+                chunk = chunks[row][col] = pg.Surface((w, h), pg.SRCALPHA)
+            chunk.blit(image, ((x % CHUNK_TILES) * tile_size, (y % CHUNK_TILES) * tile_size))
     
     def _create_collision_map(self) -> list[pg.Rect]:
         rects = []
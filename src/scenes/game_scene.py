@@ -5,10 +5,11 @@ import time
 from src.scenes.scene import Scene
 from src.core import GameManager, OnlineManager
 from src.utils import Logger, PositionCamera, GameSettings, Position
-from src.core.services import sound_manager, scene_manager
+from src.core.services import sound_manager, scene_manager, input_manager
 from src.sprites import Sprite
 from typing import override
 from src.interface.components.button import Button
+from src.interface.components.net_graph import NetGraph
 
 class GameScene(Scene):
     game_manager: GameManager
@@ -17,6 +18,8 @@ class GameScene(Scene):
     bag_button: Button
     setting_button: Button
     gps_button: Button
+    # F3 shows it, F4 saves its samples to saves/ as CSV
+    net_graph: NetGraph | None
     return_to: str
     
     def __init__(self):
@@ -38,6 +41,8 @@ class GameScene(Scene):
             self.online_manager = OnlineManager()
         else:
             self.online_manager = None
+        # Below the minimap
+        self.net_graph = NetGraph(self.online_manager.telemetry, 10, 220) if self.online_manager else None
         self.sprite_online = Sprite("ingame_ui/options1.png", (GameSettings.TILE_SIZE, GameSettings.TILE_SIZE))
 
 
@@ -92,18 +97,16 @@ class GameScene(Scene):
         minimap_x = 10
         minimap_y = 10
 
-        # 看地圖表面
-        map_surface = self.game_manager.current_map._surface
-        map_width = map_surface.get_width()
-        map_height = map_surface.get_height()
+        # 看地圖大小
+        map_width, map_height = self.game_manager.current_map.pixel_size
 
         # 縮放比例
         scale_x = minimap_size / map_width
         scale_y = minimap_size / map_height
         scale = min(scale_x, scale_y)
 
-        # minimap
-        scaled_map = pg.transform.scale(map_surface, (int(map_width * scale), int(map_height * scale)))
+        # minimap (the map caches it)
+        scaled_map = self.game_manager.current_map.get_minimap(minimap_size)
         
         # 畫 minimap
         screen.blit(scaled_map, (minimap_x, minimap_y))
@@ -154,6 +157,15 @@ class GameScene(Scene):
                 self.game_manager.player.direction.name
             )
 
+        if self.net_graph is not None:
+            if input_manager.key_pressed(pg.K_F3):
+                self.net_graph.toggle()
+            if input_manager.key_pressed(pg.K_F4):
+                path = f"saves/net_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+                rows = self.net_graph.telemetry.dump_csv(path)
+                Logger.info(f"Saved {rows} network samples to {path}")
+            self.net_graph.update(dt)
+
         # 更新按鈕與狀態
         self.bag_button.update(dt)
         self.setting_button.update(dt)
@@ -187,14 +199,13 @@ class GameScene(Scene):
         self.game_manager.gps.draw(screen, camera)
         
         if self.online_manager and self.game_manager.player:
-            list_online = self.online_manager.get_list_players()
+            list_online = self.online_manager.get_interpolated_players(self.game_manager.current_map.path_name)
+            cam = self.game_manager.player.camera
             for player in list_online:
-                if player["map"] == self.game_manager.current_map.path_name:
-                    cam = self.game_manager.player.camera
-                    pos = cam.transform_position_as_position(Position(player["x"], player["y"]))
-                    direction = player.get("direction", "DOWN")
-                    self.sprite_online.update_pos(pos)
-                    self.sprite_online.draw(screen)
+                pos = cam.transform_position_as_position(Position(player["x"], player["y"]))
+                direction = player.get("direction", "DOWN")
+                self.sprite_online.update_pos(pos)
+                self.sprite_online.draw(screen)
 
         # 放包包與設定及GPS按鈕
         self.bag_button.draw(screen)
@@ -203,3 +214,5 @@ class GameScene(Scene):
 
         # minimap
         self._draw_minimap(screen)
+        if self.net_graph is not None:
+            self.net_graph.draw(screen)